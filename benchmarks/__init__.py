@@ -0,0 +1,7 @@
+"""Бенчмарки rio-diff на синтетических GeoTIFF.
+
+Запуск: ``python -m benchmarks --help``. Растры генерируются локально
+(``benchmarks.synthetic``), каждая фаза сравнения замеряется отдельно
+(``benchmarks.runner``), результаты сохраняются в JSON и могут быть
+сопоставлены с прошлым прогоном для поиска регрессий.
+"""
@@ -0,0 +1,65 @@
+import json
+import tempfile
+from pathlib import Path
+
+import click
+
+from benchmarks import runner, synthetic
+
+_DEFAULT_OUTPUT = Path(__file__).parent / "results"
+_DEFAULT_WORKDIR = Path(tempfile.gettempdir()) / "rio-diff-bench"
+_PHASES = ("hash", "props", "diff", "stats", "compare", "render")
+
+
+@click.command()
+@click.option("--quick", is_flag=True, help="Small matrix of 512px rasters for a fast check.")
+@click.option("--full", is_flag=True, help="Full cartesian product of all axes instead of one axis at a time.")
+@click.option("--case", "case_filter", default=None, help="Only run cases whose id contains this substring.")
+@click.option("--phase", "phases", multiple=True, type=click.Choice(_PHASES), help="Only measure these phases.")
+@click.option("--repeat", default=3, show_default=True, help="Timing repetitions per phase (best is kept).")
+@click.option("--workdir", type=click.Path(), default=str(_DEFAULT_WORKDIR), show_default=True,
+              help="Where synthetic rasters are generated and cached.")
+@click.option("--output", type=click.Path(), default=str(_DEFAULT_OUTPUT), show_default=True,
+              help="Directory for the JSON results.")
+@click.option("--baseline", type=click.Path(exists=True), default=None,
+              help="Previous results file to check for regressions.")
+@click.option("--threshold", default=0.2, show_default=True,
+              help="Relative slowdown reported as a regression.")
+def main(quick, full, case_filter, phases, repeat, workdir, output, baseline, threshold):
+    """Run the rio-diff benchmark suite on synthetic GeoTIFFs."""
+    cases = synthetic.matrix(synthetic.QUICK_AXES if quick else None, full=full)
+    if case_filter:
+        cases = [case for case in cases if case_filter in case.id]
+
+    results = []
+    for case in cases:
+        item = runner.run_case(case, workdir, repeat, list(phases))
+        results.append(item)
+        timings = "  ".join(f"{name}={stats['wall']:.3f}s" for name, stats in item["phases"].items())
+        click.echo(f"{case.id}  {timings}")
+
+    path = runner.save(results, output)
+    click.echo(f"Results saved to {path}")
+
+    if baseline:
+        generator = json.loads(Path(baseline).read_text())["environment"].get("generator")
+        if generator != synthetic.GENERATOR:
+            click.secho(
+                f"Baseline rasters came from generator {generator or 'unknown'}, this run used "
+                f"{synthetic.GENERATOR}: timings compare different data",
+                fg="yellow",
+                err=True,
+            )
+        regressions = runner.compare_with(baseline, results, threshold)
+        for case_id, phase, old_wall, new_wall in regressions:
+            click.secho(
+                f"REGRESSION {case_id} {phase}: {old_wall:.3f}s -> {new_wall:.3f}s "
+                f"({new_wall / old_wall - 1:+.0%})",
+                fg="red",
+            )
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Контроль стоимости импорта плагина.
+
+``rio`` импортирует ``rio_diff.scripts.cli`` через entry point при каждом
+запуске, в том числе ``rio info`` или ``rio --help``. Проверяется, что этот
+импорт не тянет numpy/rasterio и модули сравнения, и что его собственное
+время (без click) укладывается в бюджет. Запуск: ``python -m benchmarks.import_time``.
+"""
+
+import json
+import shutil
+import subprocess
+import sys
+import time
+
+import click
+
+_MODULE = "rio_diff.scripts.cli"
+
+# Модули, которые должны загружаться только при запуске ``rio diff``.
+_DEFERRED = (
+    "numpy",
+    "rasterio",
+    "affine",
+    "rio_diff.aio",
+    "rio_diff.compare",
+    "rio_diff.models",
+    "rio_diff.render",
+    "rio_diff.serialize",
+)
+
+
+def _loaded_modules() -> set[str]:
+    code = f"import sys, json, click; import {_MODULE}; print(json.dumps(sorted(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return set(json.loads(output))
+
+
+def _import_seconds() -> float:
+    """Накопленное время импорта ``_MODULE`` по ``-X importtime`` (click предзагружен).
+
+    Строка ``rio_diff`` — только ``__init__`` пакета; накопленное время модуля
+    плагина включает и его, и ``rio_diff.scripts``, и всё, что он импортирует.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import click; import {_MODULE}"],
+        check=True, capture_output=True, text=True,
+    )
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        _, _, rest = line.partition(":")
+        parts = [part.strip() for part in rest.split("|")]
+        if len(parts) == 3 and parts[2] == _MODULE:
+            return int(parts[1]) / 1e6
+    raise RuntimeError(f"{_MODULE} not found in -X importtime output")
+
+
+def _command_seconds(args: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, check=True, capture_output=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@click.command()
+@click.option("--budget", default=0.02, show_default=True, help="Allowed plugin import time, seconds.")
+@click.option("--repeat", default=5, show_default=True, help="Repetitions for the timings (best is kept).")
+def main(budget, repeat):
+    """Check that importing the rio plugin stays cheap."""
+    failed = False
+
+    leaked = sorted(module for module in _DEFERRED if module in _loaded_modules())
+    if leaked:
+        click.secho(f"Eagerly imported by {_MODULE}: {', '.join(leaked)}", fg="red")
+        failed = True
+
+    seconds = min(_import_seconds() for _ in range(repeat))
+    click.echo(f"import {_MODULE} (cumulative, click preloaded): {seconds * 1000:.1f} ms")
+    if seconds > budget:
+        click.secho(f"Import time exceeds the budget of {budget * 1000:.1f} ms", fg="red")
+        failed = True
+
+    rio = shutil.which("rio")
+    if rio is not None:
+        for args in ([rio, "--help"], [rio, "diff", "--version"]):
+            click.echo(f"{' '.join(args[1:]) or 'rio'}: {_command_seconds(args, repeat) * 1000:.0f} ms")
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
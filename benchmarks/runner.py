@@ -0,0 +1,148 @@
+"""Замеры фаз сравнения и сопоставление результатов между прогонами.
+
+Каждая фаза замеряется дважды: время — как лучшее из ``repeat`` прогонов без
+трассировки, память — отдельным прогоном под ``tracemalloc`` (пик
+выделений Python и numpy; память внутри GDAL он не видит). Дополнительно
+сохраняется ``max_rss`` процесса после каждого случая.
+"""
+
+import contextlib
+import dataclasses
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+import rio_diff
+from rio_diff import compare, models, render, utils
+from rio_diff.scripts.cli import _collect_checks
+
+from benchmarks.synthetic import GENERATOR, Case, generate
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _max_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _render(report: models.RasterDiff) -> None:
+    # Те же проверки, что собирает ``rio diff`` без флагов (--checksum выключен).
+    checks = _collect_checks(report, {"checksum"})
+    with contextlib.redirect_stdout(io.StringIO()):
+        render.print_report([check for _, check in checks], report.pixel_values, show_pixel_values=True)
+
+
+def _phases(base: str, test: str, selected: list[str] | None = None) -> dict[str, Callable[[], object]]:
+    """Фазы сравнения в том виде, в каком их выполняет ``compare_rasters``.
+
+    ``selected`` — только эти фазы (по умолчанию все).
+    """
+    def no_pam(func):
+        def run():
+            with rasterio.Env(GDAL_PAM_ENABLED="NO"):
+                return func()
+        return run
+
+    phases = {
+        "hash": lambda: (utils.calc_hash(base), utils.calc_hash(test)),
+        "props": no_pam(lambda: (compare.read_raster_props(base), compare.read_raster_props(test))),
+        "diff": no_pam(lambda: compare.calc_diff(base, test)),
+        # Путь без попиксельного сравнения: статистика обоих растров сразу.
+        "stats": no_pam(lambda: compare._calc_stats_pair(base, test, approx=False, progress=None)),
+        "compare": lambda: compare.compare_rasters(base, test),
+    }
+    if selected:
+        phases = {name: func for name, func in phases.items() if name in selected}
+    if not selected or "render" in selected:
+        # Отчёт для вывода считается заранее и в замер не входит.
+        report = compare.compare_rasters(base, test)
+        if report is not None:  # побайтно одинаковые растры выводить нечего
+            phases["render"] = lambda: _render(report)
+    return phases
+
+
+def _measure(func: Callable[[], object], repeat: int) -> dict:
+    wall = cpu = float("inf")
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        func()
+        wall = min(wall, time.perf_counter() - wall_start)
+        cpu = min(cpu, time.process_time() - cpu_start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"wall": wall, "cpu": cpu, "peak_alloc": peak}
+
+
+def run_case(case: Case, workdir: str | Path, repeat: int, phases: list[str] | None = None) -> dict:
+    base, test = (str(path) for path in generate(case, workdir))
+    results = {name: _measure(func, repeat) for name, func in _phases(base, test, phases).items()}
+    return {
+        "case": case.id,
+        "params": dataclasses.asdict(case),
+        "phases": results,
+        "max_rss": _max_rss_bytes(),
+    }
+
+
+def environment() -> dict:
+    return {
+        "rio_diff": rio_diff.__version__,
+        "generator": GENERATOR,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "rasterio": rasterio.__version__,
+        "gdal": rasterio.__gdal_version__,
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def save(results: list[dict], output_dir: str | Path) -> Path:
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    env = environment()
+    stamp = env["timestamp"].replace(":", "").replace("-", "")
+    path = output_dir / f"{env['rio_diff']}-{stamp}.json"
+    path.write_text(json.dumps({"environment": env, "results": results}, indent=2))
+    return path
+
+
+def compare_with(baseline_path: str | Path, results: list[dict], threshold: float) -> list[tuple]:
+    """Найти регрессии относительно сохранённого прогона.
+
+    Регрессией считается рост времени фазы больше чем в ``1 + threshold`` раз.
+    Возвращает список ``(case, phase, old_wall, new_wall)``.
+    """
+    baseline = json.loads(Path(baseline_path).read_text())
+    old = {
+        (item["case"], phase): stats["wall"]
+        for item in baseline["results"]
+        for phase, stats in item["phases"].items()
+    }
+    regressions = []
+    for item in results:
+        for phase, stats in item["phases"].items():
+            old_wall = old.get((item["case"], phase))
+            if old_wall and stats["wall"] > old_wall * (1 + threshold):
+                regressions.append((item["case"], phase, old_wall, stats["wall"]))
+    return regressions
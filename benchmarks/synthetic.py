@@ -0,0 +1,150 @@
+"""Генерация синтетических пар растров для бенчмарков.
+
+Каждый случай описывается ``Case``: размер, тип данных, число каналов,
+раскладка (тайлы/полосы), сжатие, способ маскирования и доля отличающихся
+пикселей. Растры пишутся полосами, так что генерация крупных случаев не
+требует держать весь массив в памяти. Данные детерминированы (фиксированный
+seed), поэтому повторные прогоны сравнивают одно и то же.
+
+Готовые пары кешируются в рабочем каталоге. В имя файла входит ``GENERATOR``
+— хеш исходника этого модуля, так что после любой правки генератора растры
+создаются заново, а не берутся из кеша от прежней версии.
+"""
+
+import dataclasses
+import hashlib
+import itertools
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+_STRIP_ROWS = 512
+_SEED = 20240101
+
+# Версия генератора: растры из кеша годятся, только если созданы тем же кодом.
+GENERATOR = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:12]
+
+
+@dataclasses.dataclass(frozen=True)
+class Case:
+    size: int = 2048
+    dtype: str = "uint16"
+    bands: int = 3
+    layout: str = "tiled"  # tiled | striped
+    compress: str | None = None  # None | deflate | lzw | zstd ...
+    masking: str = "none"  # none | nodata | mask
+    density: float = 0.01  # доля пикселей test, отличающихся от base
+
+    @property
+    def id(self) -> str:
+        return (
+            f"{self.size}px-{self.dtype}-{self.bands}b-{self.layout}-"
+            f"{self.compress or 'raw'}-{self.masking}-d{self.density:g}"
+        )
+
+
+DEFAULT = Case()
+
+# Значения по осям матрицы. По умолчанию каждая ось варьируется отдельно
+# относительно DEFAULT (one-factor-at-a-time), полный перебор — через full=True.
+AXES = {
+    "size": (512, 2048, 4096),
+    "dtype": ("uint8", "uint16", "float32"),
+    "bands": (1, 3, 8),
+    "layout": ("tiled", "striped"),
+    "compress": (None, "deflate"),
+    "masking": ("none", "nodata", "mask"),
+    "density": (0.0, 0.01, 1.0),
+}
+
+QUICK_AXES = {
+    "size": (512,),
+    "dtype": ("uint8", "float32"),
+    "masking": ("none", "mask"),
+    "density": (0.0, 0.01),
+}
+
+
+def matrix(axes: dict[str, tuple] | None = None, full: bool = False) -> list[Case]:
+    axes = AXES if axes is None else axes
+    if full:
+        names = list(axes)
+        return [Case(**dict(zip(names, values))) for values in itertools.product(*axes.values())]
+    base = dataclasses.replace(DEFAULT, size=min(axes.get("size", (DEFAULT.size,))))
+    cases = {base.id: base}
+    for name, values in axes.items():
+        for value in values:
+            case = dataclasses.replace(base, **{name: value})
+            cases.setdefault(case.id, case)
+    return list(cases.values())
+
+
+def _profile(case: Case) -> dict:
+    profile = {
+        "driver": "GTiff",
+        "width": case.size,
+        "height": case.size,
+        "count": case.bands,
+        "dtype": case.dtype,
+        "crs": "EPSG:32637",
+        "transform": from_origin(500000, 6000000, 10, 10),
+    }
+    if case.layout == "tiled":
+        profile.update(tiled=True, blockxsize=256, blockysize=256)
+    else:
+        profile.update(tiled=False, blockysize=16)
+    if case.compress:
+        profile["compress"] = case.compress
+    if case.masking == "nodata":
+        profile["nodata"] = 0
+    return profile
+
+
+def _strip(case: Case, rng: np.random.Generator, rows: int) -> np.ndarray:
+    shape = (case.bands, rows, case.size)
+    if np.dtype(case.dtype).kind == "f":
+        return rng.random(shape, dtype=np.float32).astype(case.dtype) * 1000
+    info = np.iinfo(case.dtype)
+    # Не выше max - 1: отличающиеся пиксели получают +1 и не должны
+    # переполниться в 0 (nodata при masking="nodata").
+    return rng.integers(max(info.min, 1), min(info.max - 1, 10000), shape, dtype=case.dtype, endpoint=True)
+
+
+def generate(case: Case, directory: str | Path) -> tuple[Path, Path]:
+    """Создать (или взять готовую) пару base/test для случая."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    base_path = directory / f"{case.id}-{GENERATOR}-base.tif"
+    test_path = directory / f"{case.id}-{GENERATOR}-test.tif"
+    if base_path.exists() and test_path.exists():
+        return base_path, test_path
+
+    profile = _profile(case)
+    rng = np.random.default_rng(_SEED)
+    with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True), \
+            rasterio.open(base_path, "w", **profile) as base_ds, \
+            rasterio.open(test_path, "w", **profile) as test_ds:
+        for row in range(0, case.size, _STRIP_ROWS):
+            rows = min(_STRIP_ROWS, case.size - row)
+            window = Window(0, row, case.size, rows)
+            base = _strip(case, rng, rows)
+            test = base.copy()
+            if case.density:
+                changed = rng.random((rows, case.size)) < case.density
+                test[:, changed] += np.asarray(1, dtype=case.dtype)
+            if case.masking == "nodata":
+                holes = rng.random((rows, case.size)) < 0.05
+                base[:, holes] = 0
+                test[:, holes] = 0
+            base_ds.write(base, window=window)
+            test_ds.write(test, window=window)
+            if case.masking == "mask":
+                mask = np.full((rows, case.size), 255, dtype="uint8")
+                mask[:, : case.size // 10] = 0
+                base_ds.write_mask(mask, window=window)
+                mask[:, : case.size // 8] = 0
+                test_ds.write_mask(mask, window=window)
+    return base_path, test_path
@@ -2,4 +2,22 @@
 
 __version__ = "1.0.0a5"
 
-from .compare import compare_rasters  # noqa
+# Пакет подгружается ``rio`` через entry point при каждом запуске, поэтому
+# модули с numpy/rasterio импортируются лениво — при первом обращении.
+_LAZY_ATTRS = {
+    "compare_rasters": "rio_diff.compare",
+    "compare_rasters_async": "rio_diff.aio",
+    "AsyncSession": "rio_diff.aio",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRS:
+        import importlib
+
+        return getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_LAZY_ATTRS])
@@ -0,0 +1,122 @@
+"""Асинхронный интерфейс сравнения для встраивания в asyncio-сервисы.
+
+``compare_rasters`` — блокирующий вызов, поэтому здесь он целиком уходит в
+пул потоков, а цикл событий остаётся свободным. Остановка кооперативная:
+``compare_rasters`` проверяет флаг между блоками хеширования и окнами
+растра, так что отмена задачи или истёкший срок освобождают поток в пределах
+одного окна.
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from rio_diff import models
+from rio_diff.compare import compare_rasters
+
+
+class _Interrupt:
+    """Флаг остановки для ``compare_rasters(stop=...)``: отмена или срок."""
+
+    def __init__(self, deadline: float | None):
+        self._cancelled = threading.Event()
+        self._deadline = deadline  # по time.monotonic()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def __call__(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+
+def _effective_deadline(
+    loop: asyncio.AbstractEventLoop, timeout: float | None, deadline: float | None,
+) -> float | None:
+    if timeout is not None:
+        deadline = loop.time() + timeout if deadline is None else min(deadline, loop.time() + timeout)
+    return deadline
+
+
+async def compare_rasters_async(
+    base_raster: str,
+    test_raster: str,
+    *,
+    timeout: float | None = None,
+    deadline: float | None = None,
+    executor: Executor | None = None,
+    **kwargs,
+) -> models.RasterDiff | None:
+    """Асинхронная обёртка над ``compare_rasters``.
+
+    ``timeout`` задаётся в секундах от вызова, ``deadline`` — моментом по часам
+    цикла событий (``loop.time()``); действует более ранний из них. Когда срок
+    истекает, сравнение останавливается и возвращается частичный отчёт с
+    ``complete=False``. Отмена задачи останавливает работу в пуле, дожидается
+    освобождения потока и пробрасывает ``CancelledError``.
+
+    Остальные аргументы передаются в ``compare_rasters`` как есть; ``progress``
+    при этом вызывается из рабочего потока.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = _effective_deadline(loop, timeout, deadline)
+    interrupt = _Interrupt(None if deadline is None else time.monotonic() + (deadline - loop.time()))
+    future = loop.run_in_executor(
+        executor,
+        functools.partial(compare_rasters, base_raster, test_raster, stop=interrupt, **kwargs),
+    )
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        interrupt.cancel()
+        # Не отпускаем вызывающего, пока поток держит открытые датасеты.
+        await asyncio.wait({future})
+        raise
+
+
+class AsyncSession:
+    """Общий пул потоков и ограничение числа одновременных сравнений.
+
+    Пример::
+
+        async with AsyncSession(max_concurrency=4) as session:
+            report = await session.compare(base, test, timeout=30)
+
+    Срок (``timeout``/``deadline``) отсчитывается с момента вызова
+    ``compare``, то есть включает ожидание свободного слота.
+    """
+
+    def __init__(self, max_concurrency: int = 4, executor: Executor | None = None):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="rio-diff",
+        )
+
+    async def compare(
+        self,
+        base_raster: str,
+        test_raster: str,
+        *,
+        timeout: float | None = None,
+        deadline: float | None = None,
+        **kwargs,
+    ) -> models.RasterDiff | None:
+        deadline = _effective_deadline(asyncio.get_running_loop(), timeout, deadline)
+        async with self._semaphore:
+            return await compare_rasters_async(
+                base_raster, test_raster, deadline=deadline, executor=self._executor, **kwargs,
+            )
+
+    async def close(self) -> None:
+        if self._owns_executor:
+            await asyncio.to_thread(self._executor.shutdown)
+
+    async def __aenter__(self) -> "AsyncSession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
@@ -1,13 +1,21 @@
+import contextlib
+import functools
+import hashlib
 import math
+import multiprocessing
+import os
+import threading
 import warnings
 from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
 
 import numpy as np
 import rasterio
 from rasterio.enums import MaskFlags
+from rasterio.errors import RasterioDeprecationWarning, RasterioError
 
-from rio_diff import models, utils
+from rio_diff import models, profiling, rawio, regions, utils
 
 # Ограничение блок-кэша GDAL. По умолчанию GDAL отводит под кэш ~5% ОЗУ, из-за
 # чего сквозной обход всех тайлов растра раздувает потребление памяти до
@@ -15,8 +23,26 @@ from rio_diff import models, utils
 # бесполезен и его можно держать маленьким.
 GDAL_CACHEMAX_BYTES = 256 * 1024 * 1024
 
+# Число потоков для параллельного обхода окон при расчёте статистики. Чтение
+# блоков в GDAL и редукции numpy отпускают GIL, так что потоки работают
+# действительно параллельно, а каждый держит свой дескриптор датасета.
+STATS_WORKERS = min(8, os.cpu_count() or 1)
 
-_EXCLUDED_TAG_NAMESPACES = {"IMAGE_STRUCTURE", "DERIVED_SUBDATASETS", "RPC"}
+# Сколько задач dask-бэкенда приходится на один процесс: несколько кусков окон
+# на процесс сглаживают разницу в стоимости окон (сжатие, маски, nodata).
+_DASK_CHUNKS_PER_WORKER = 4
+
+# Как часто при сравнении подсетов проверяется ``stop``, пока пул занят.
+_SUBDATASET_STOP_POLL_SECONDS = 0.1
+
+
+# SUBDATASETS повторяет ds.subdatasets, но с путями к файлу; подсеты
+# сравниваются по ключам без путей в image_structure.
+_EXCLUDED_TAG_NAMESPACES = {"IMAGE_STRUCTURE", "SUBDATASETS", "DERIVED_SUBDATASETS", "RPC"}
+
+
+class UnknownBandError(ValueError):
+    """Поканальный допуск задан для канала, которого нет в растре."""
 
 
 def _read_colormaps(ds) -> list:
@@ -34,6 +60,19 @@ def _read_metadata(ds) -> dict:
     return {"default": ds.tags(), **{ns: ds.tags(ns=ns) for ns in namespaces}}
 
 
+def subdataset_key(name: str, container: str) -> str:
+    """Ключ для сопоставления подсетов двух контейнеров.
+
+    Имя подсета содержит путь к контейнеру (``NETCDF:"/data/a.nc":tas``,
+    ``GTIFF_DIR:2:/data/a.tif``), а он у base и test разный. Путь заменяется
+    на ``*``: ``NETCDF:*:tas``.
+    """
+    for token in (f'"{container}"', container):
+        if token in name:
+            return name.replace(token, "*", 1)
+    return name
+
+
 def read_raster_props(inp_file: str) -> models.RasterProps:
     with rasterio.open(inp_file) as ds:
         gcp_points, gcp_crs = ds.gcps
@@ -65,20 +104,21 @@ def read_raster_props(inp_file: str) -> models.RasterProps:
                 "interleave": ds.interleaving.name if ds.interleaving else None,
                 "photometric": ds.photometric.name if ds.photometric else None,
                 "block_shapes": ds.block_shapes,
-                "subdatasets": ds.subdatasets,
+                "subdatasets": [subdataset_key(name, inp_file) for name in ds.subdatasets],
             },
             metadata=_read_metadata(ds),
             bands_metadata=[ds.tags(bidx=bidx) for bidx in range(1, ds.count + 1)],
         )
 
 
+def _same_nodata(base: float | None, test: float | None) -> bool:
+    return base == test or (base is not None and test is not None and math.isnan(base) and math.isnan(test))
+
+
 def _nodata_equal(base: tuple, test: tuple) -> bool:
     if len(base) != len(test):
         return False
-    return all(
-        b == t or (b is not None and t is not None and math.isnan(b) and math.isnan(t))
-        for b, t in zip(base, test)
-    )
+    return all(_same_nodata(b, t) for b, t in zip(base, test))
 
 
 class _StatsAccumulator:
@@ -105,6 +145,14 @@ class _StatsAccumulator:
             self.min = np.fmin(self.min, np.nanmin(arr, axis=(1, 2)))
             self.max = np.fmax(self.max, np.nanmax(arr, axis=(1, 2)))
 
+    def merge(self, other: "_StatsAccumulator") -> None:
+        """Добавить частичный результат, посчитанный по другой части окон."""
+        self.valid += other.valid
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+
     def result(self) -> list[models.BandStats]:
         stats = []
         for b in range(len(self.valid)):
@@ -130,30 +178,243 @@ def _needs_mask_read(ds) -> bool:
     )
 
 
+class _MaskReader:
+    """Чтение масок окна без повторов.
+
+    ``ds.read_masks(window=...)`` возвращает отдельную маску для каждого
+    канала, хотя маска уровня датасета (в том числе альфа-канал RGBA) у всех
+    использующих её каналов одна и та же. Такая маска читается один раз на
+    окно, каналы с флагом ``all_valid`` не читаются вовсе, остальные —
+    поканально.
+    """
+
+    def __init__(self, ds):
+        self._ds = ds
+        flags = ds.mask_flag_enums
+        self._shared = [b for b, band in enumerate(flags) if MaskFlags.per_dataset in band]
+        self._own = [
+            b for b, band in enumerate(flags)
+            if MaskFlags.per_dataset not in band and list(band) != [MaskFlags.all_valid]
+        ]
+
+    def read(self, window) -> list[np.ndarray | None]:
+        """Маски окна по каналам (0 — невалидный пиксель, 255 — валидный,
+        альфа-канал — как есть), ``None`` — все пиксели валидны.
+
+        Каналы с общей маской ссылаются на один и тот же массив.
+        """
+        masks = [None] * self._ds.count
+        if self._shared:
+            shared = self._ds.read_masks(self._shared[0] + 1, window=window)
+            for b in self._shared:
+                masks[b] = shared
+        for b in self._own:
+            masks[b] = self._ds.read_masks(b + 1, window=window)
+        return masks
+
+
+def _apply_masks(arr: np.ndarray, masks: list[np.ndarray | None]) -> None:
+    invalid: dict[int, np.ndarray] = {}
+    for b, mask in enumerate(masks):
+        if mask is not None:
+            if id(mask) not in invalid:
+                invalid[id(mask)] = mask == 0
+            arr[b][invalid[id(mask)]] = np.nan
+
+
+def _count_mask_diff(
+    base_masks: list[np.ndarray | None],
+    test_masks: list[np.ndarray | None],
+) -> np.ndarray:
+    """Число пикселей с разными значениями маски по каналам.
+
+    Сравниваются значения, а не только валидность: частичная прозрачность
+    альфа-канала тоже считается различием. Пара общих масок сравнивается
+    один раз, результат приписывается всем каналам, которые её используют.
+    """
+    counts = np.zeros(len(base_masks), dtype=np.int64)
+    cache: dict[tuple[int, int], int] = {}
+    for b, (base_band, test_band) in enumerate(zip(base_masks, test_masks)):
+        key = (id(base_band), id(test_band))
+        if key not in cache:
+            if base_band is None and test_band is None:
+                cache[key] = 0
+            elif base_band is None:
+                cache[key] = np.count_nonzero(test_band != 255)
+            elif test_band is None:
+                cache[key] = np.count_nonzero(base_band != 255)
+            else:
+                cache[key] = np.count_nonzero(base_band != test_band)
+        counts[b] = cache[key]
+    return counts
+
+
+def _window_reader(ds, raw_io: bool = True, profile: profiling.PhaseProfile | None = None) -> Callable:
+    """Функция чтения окна: через memory map, если растр это позволяет
+    (см. ``rawio``), иначе — обычный ``ds.read``.
+
+    В ``profile`` окно, прочитанное через GDAL, идёт в ``blocks_decoded``
+    (по блоку на канал), а отданное из отображения — в ``mapped_bytes``:
+    такие байты не проходят через ``read()`` и не видны в ``/proc/self/io``.
+    """
+    raw = rawio.reader(ds) if raw_io else None
+
+    def read(window):
+        arr = raw.read(window) if raw is not None else None
+        if arr is None:
+            arr = ds.read(window=window)
+            if profile is not None:
+                profile.add(blocks_decoded=ds.count)
+        elif profile is not None:
+            profile.add(mapped_bytes=arr.nbytes)
+        return arr
+
+    return read
+
+
+def _missing(arr: np.ndarray, nodata: float | None) -> np.ndarray:
+    """Пиксели без значения: NaN или nodata."""
+    missing = np.isnan(arr)
+    if nodata is not None and not math.isnan(nodata):
+        missing |= arr == nodata
+    return missing
+
+
 def _mask_nodata(arr: np.ndarray, nodatavals: tuple) -> None:
     for b, nodata in enumerate(nodatavals):
         if nodata is not None:
             arr[b][arr[b] == nodata] = np.nan
 
 
+def _env_options() -> dict:
+    """Опции текущего ``rasterio.Env``.
+
+    Окружение rasterio привязано к потоку, поэтому в рабочие потоки его
+    нужно передавать явно, иначе там, например, снова включится GDAL PAM.
+    """
+    return rasterio.env.getenv() if rasterio.env.hasenv() else {}
+
+
+class _WindowCounter:
+    """Потокобезопасный пересчёт обработанных окон в долю для ``progress``."""
+
+    def __init__(self, total: int, progress: Callable[[float], None] | None):
+        self._total = total
+        self._progress = progress
+        self._done = 0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> None:
+        if self._progress is None:
+            return
+        with self._lock:
+            self._done += 1
+            self._progress(self._done / self._total)
+
+
+def _split(items: list, parts: int) -> list[list]:
+    size = math.ceil(len(items) / parts)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _stats_chunk(
+    raster_path: str,
+    windows: list,
+    env_options: dict,
+    on_window: Callable[[], None],
+    profile: profiling.PhaseProfile | None = None,
+    stop: Callable[[], bool] | None = None,
+) -> _StatsAccumulator:
+    with rasterio.Env(**{**env_options, "GDAL_CACHEMAX": GDAL_CACHEMAX_BYTES}), \
+            rasterio.open(raster_path) as ds:
+        acc = _StatsAccumulator(ds.count)
+        masks = _MaskReader(ds) if _needs_mask_read(ds) else None
+        read = _window_reader(ds, profile=profile)
+        processed = 0
+        for window in windows:
+            if stop is not None and stop():
+                break
+            with profiling.timer(profile, "read"):
+                raw = read(window)
+                band_masks = masks.read(window) if masks is not None else None
+            with profiling.timer(profile, "reduce"):
+                arr = raw.astype("float64", order="C")
+                _mask_nodata(arr, ds.nodatavals)
+                if band_masks is not None:
+                    _apply_masks(arr, band_masks)
+                acc.update(arr)
+            processed += 1
+            on_window()
+        if profile is not None:
+            profile.add(windows=processed)
+        return acc
+
+
+def _approx_stats(raster_path: str) -> list[models.BandStats]:
+    """Статистика средствами GDAL: из тегов STATISTICS_* или по обзорам.
+
+    Значения могут быть устаревшими или приближёнными, поэтому используются
+    только по явному согласию пользователя.
+    """
+    stats = []
+    with rasterio.open(raster_path) as ds, warnings.catch_warnings():
+        # statistics() объявлен устаревшим, но только он учитывает STATISTICS_*.
+        warnings.simplefilter("ignore", RasterioDeprecationWarning)
+        for bidx in ds.indexes:
+            try:
+                band = ds.statistics(bidx, approx=True)
+            except RasterioError:  # нет ни одного валидного пикселя
+                stats.append(models.BandStats(min=None, max=None, mean=None, std=None))
+                continue
+            stats.append(models.BandStats(
+                min=float(band.min),
+                max=float(band.max),
+                mean=float(band.mean),
+                std=float(band.std),
+            ))
+    return stats
+
+
 def calc_stats(
     raster_path: str,
     progress: Callable[[float], None] | None = None,
+    *,
+    workers: int | None = None,
+    approx: bool = False,
+    profile: profiling.PhaseProfile | None = None,
+    stop: Callable[[], bool] | None = None,
 ) -> list[models.BandStats]:
-    with rasterio.Env(GDAL_CACHEMAX=GDAL_CACHEMAX_BYTES), \
-            rasterio.open(raster_path) as ds:
-        acc = _StatsAccumulator(ds.count)
-        needs_mask = _needs_mask_read(ds)
+    """Посчитать статистику по каналам растра.
+
+    Окна делятся на непрерывные куски, которые обрабатываются в ``workers``
+    потоках, после чего частичные результаты сливаются. При ``approx=True``
+    статистика берётся у GDAL (см. ``_approx_stats``) без полного обхода.
+    ``stop`` проверяется перед каждым окном: если он вернул True, обход
+    прекращается и статистика считается по уже прочитанным окнам.
+    """
+    if approx:
+        stats = _approx_stats(raster_path)
+        if progress is not None:
+            progress(1.0)
+        return stats
+
+    with rasterio.open(raster_path) as ds:
+        if not ds.count:  # контейнер подсетов без собственных каналов
+            return []
         windows = [window for _, window in ds.block_windows(1)]
-        for done, window in enumerate(windows, start=1):
-            arr = ds.read(window=window).astype("float64")
-            _mask_nodata(arr, ds.nodatavals)
-            if needs_mask:
-                arr[ds.read_masks(window=window) == 0] = np.nan
-            acc.update(arr)
-            if progress is not None:
-                progress(done / len(windows))
-        return acc.result()
+    chunks = _split(windows, max(1, min(workers or STATS_WORKERS, len(windows))))
+    on_window = _WindowCounter(len(windows), progress)
+    env_options = _env_options()
+
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        accs = list(pool.map(
+            lambda chunk: _stats_chunk(raster_path, chunk, env_options, on_window, profile, stop),
+            chunks,
+        ))
+    acc = accs[0]
+    for other in accs[1:]:
+        acc.merge(other)
+    return acc.result()
 
 
 def is_compatible_rasters(base_raster: str, test_raster: str) -> bool:
@@ -171,124 +432,539 @@ def is_compatible_rasters(base_raster: str, test_raster: str) -> bool:
         return base_ds.shape == test_ds.shape and base_ds.count == test_ds.count
 
 
+class _DiffAccumulator:
+    """Потоковый расчёт попиксельных различий по каналам.
+
+    Частичные результаты по разным наборам окон сливаются через ``merge``,
+    поэтому окна можно обрабатывать независимо — в том числе в других процессах.
+    """
+
+    def __init__(self, count: int):
+        self.diff_count = np.zeros(count, dtype=np.int64)
+        self.valid_count = np.zeros(count, dtype=np.int64)
+        self.max_diff = np.zeros(count, dtype=np.float64)
+        self.sum_squared_diff = np.zeros(count, dtype=np.float64)
+        self.mask_diff_count = np.zeros(count, dtype=np.int64)
+
+    def merge(self, other: "_DiffAccumulator") -> None:
+        self.diff_count += other.diff_count
+        self.valid_count += other.valid_count
+        self.max_diff = np.maximum(self.max_diff, other.max_diff)
+        self.sum_squared_diff += other.sum_squared_diff
+        self.mask_diff_count += other.mask_diff_count
+
+    def result(self, total_pixels: int) -> list[models.PixelDiffStats]:
+        return [
+            models.PixelDiffStats(
+                diff_count=int(self.diff_count[b]),
+                total_count=total_pixels,
+                diff_percent=float((self.diff_count[b] / total_pixels) * 100),
+                max_diff=float(self.max_diff[b]),
+                rmse=(
+                    float(np.sqrt(self.sum_squared_diff[b] / self.valid_count[b]))
+                    if self.valid_count[b] else 0.0
+                ),
+                mask_diff_count=int(self.mask_diff_count[b]),
+            )
+            for b in range(len(self.diff_count))
+        ]
+
+
+def _ulp_close(base: np.ndarray, test: np.ndarray, max_ulps: int) -> np.ndarray:
+    """Значения отстоят не больше чем на ``max_ulps`` представимых чисел.
+
+    Битовое представление IEEE 754 — знак и модуль, поэтому для чисел одного
+    знака расстояние — разность модулей как целых, для разных знаков —
+    их сумма. Модули сравниваются как uint64: сумма двух модулей float64 в
+    него помещается, переполнения нет. ``-0.0`` и ``0.0`` равны.
+    """
+    native = base.dtype.newbyteorder("=")
+    bits = np.dtype(f"i{native.itemsize}")
+    limit = np.iinfo(bits).max
+    base_bits = np.ascontiguousarray(base, dtype=native).view(bits)
+    test_bits = np.ascontiguousarray(test, dtype=native).view(bits)
+    base_mag = (base_bits & limit).astype(np.uint64)
+    test_mag = (test_bits & limit).astype(np.uint64)
+    same_sign = (base_bits < 0) == (test_bits < 0)
+    max_ulps = np.uint64(min(max_ulps, np.iinfo(np.uint64).max))
+    return np.where(
+        same_sign,
+        np.maximum(base_mag, test_mag) - np.minimum(base_mag, test_mag) <= max_ulps,
+        # Вычитание справа может уйти через ноль, но тогда левая часть ложна.
+        (base_mag <= max_ulps) & (test_mag <= max_ulps - base_mag),
+    )
+
+
+def _changed(
+    raw_base: np.ndarray,
+    raw_test: np.ndarray,
+    arr_base: np.ndarray,
+    arr_test: np.ndarray,
+    abs_diff: np.ndarray,
+    tolerance: models.Tolerance,
+    equal_nan: bool,
+) -> np.ndarray:
+    """Маска отличающихся пикселей канала по допуску (общий путь).
+
+    Та же логика, что у ``np.isclose``, но без его накладных расходов:
+    равные значения (в том числе бесконечности) совпадают, иначе
+    сравнивается разность с допуском, NaN с обеих сторон — по ``equal_nan``.
+    """
+    close = arr_base == arr_test
+    if tolerance.atol or tolerance.rtol:
+        # Бесконечности равны только самим себе, как и в np.isclose.
+        with np.errstate(invalid="ignore"):
+            close |= np.isfinite(abs_diff) & (abs_diff <= tolerance.atol + tolerance.rtol * np.abs(arr_test))
+    if tolerance.max_ulps:
+        both_valid = ~(np.isnan(arr_base) | np.isnan(arr_test))  # nodata в ULP не сравнивается
+        if raw_base.dtype.kind == "f":
+            close |= both_valid & _ulp_close(raw_base, raw_test, tolerance.max_ulps)
+        else:
+            close |= both_valid & (abs_diff <= tolerance.max_ulps)
+    if equal_nan:
+        close |= np.isnan(arr_base) & np.isnan(arr_test)
+    return ~close
+
+
+def _diff_windows(
+    base_ds,
+    test_ds,
+    windows: list,
+    *,
+    tolerances: list[models.Tolerance],
+    equal_nan: bool,
+    collect_stats: bool,
+    diff_ds=None,
+    on_window: Callable[[], None] | None = None,
+    profile: profiling.PhaseProfile | None = None,
+    stop: Callable[[], bool] | None = None,
+    raw_io: bool = True,
+    labeler=None,
+) -> tuple[_DiffAccumulator, _StatsAccumulator | None, _StatsAccumulator | None]:
+    """Обойти заданные окна пары открытых датасетов и накопить результаты.
+
+    ``raw_io=False`` отключает чтение несжатых файлов через memory map.
+    ``labeler`` (``regions.RegionLabeler``) получает маску пикселей,
+    отличающихся хотя бы в одном канале, и максимальный по каналам модуль
+    разности.
+    """
+    count = base_ds.count
+    nd_base = base_ds.nodatavals
+    nd_test = test_ds.nodatavals
+    # Точное сравнение канала с одинаковыми типом и nodata с обеих сторон
+    # делается по исходным значениям: nodata совпадает там же, где и сами
+    # значения, а приведение к float64 и допуски не нужны.
+    native = [
+        tolerances[bidx].exact
+        and equal_nan
+        and base_ds.dtypes[bidx] == test_ds.dtypes[bidx]
+        and _same_nodata(nd_base[bidx], nd_test[bidx])
+        for bidx in range(count)
+    ]
+
+    acc = _DiffAccumulator(count)
+    compare_masks = any(
+        MaskFlags.per_dataset in flags
+        for flags in (*base_ds.mask_flag_enums, *test_ds.mask_flag_enums)
+    )
+    base_acc = _StatsAccumulator(count) if collect_stats else None
+    test_acc = _StatsAccumulator(count) if collect_stats else None
+    base_needs_mask = collect_stats and _needs_mask_read(base_ds)
+    test_needs_mask = collect_stats and _needs_mask_read(test_ds)
+    base_masks = _MaskReader(base_ds)
+    test_masks = _MaskReader(test_ds)
+    read_base = _window_reader(base_ds, raw_io, profile)
+    read_test = _window_reader(test_ds, raw_io, profile)
+
+    processed = 0
+    for window in windows:
+        if stop is not None and stop():
+            break
+        with profiling.timer(profile, "read"):
+            raw_base = read_base(window)
+            raw_test = read_test(window)
+            base_band_masks = test_band_masks = None
+            if compare_masks or base_needs_mask:
+                base_band_masks = base_masks.read(window)
+            if compare_masks or test_needs_mask:
+                test_band_masks = test_masks.read(window)
+
+        with profiling.timer(profile, "reduce"):
+            arr_base = raw_base.astype("float64", order="C")
+            arr_test = raw_test.astype("float64", order="C")
+
+            _mask_nodata(arr_base, nd_base)
+            _mask_nodata(arr_test, nd_test)
+
+            arr_diff = arr_base - arr_test
+            finite_mask = np.isfinite(arr_diff)
+            acc.valid_count += np.count_nonzero(finite_mask, axis=(1, 2))
+
+            if compare_masks:
+                acc.mask_diff_count += _count_mask_diff(base_band_masks, test_band_masks)
+
+            abs_diff = np.abs(arr_diff)
+            changed_any = None
+            for bidx in range(count):
+                if native[bidx]:
+                    changed = raw_base[bidx] != raw_test[bidx]
+                    if raw_base.dtype.kind in "fc":
+                        # NaN и nodata — одинаково «нет значения», как и
+                        # после маскирования в float64.
+                        changed &= ~(
+                            _missing(raw_base[bidx], nd_base[bidx]) & _missing(raw_test[bidx], nd_test[bidx])
+                        )
+                else:
+                    changed = _changed(
+                        raw_base[bidx],
+                        raw_test[bidx],
+                        arr_base[bidx],
+                        arr_test[bidx],
+                        abs_diff[bidx],
+                        tolerances[bidx],
+                        equal_nan,
+                    )
+                acc.diff_count[bidx] += np.count_nonzero(changed)
+                if labeler is not None:
+                    changed_any = changed if changed_any is None else changed_any | changed
+            if labeler is not None:
+                labeler.update(window, changed_any, np.nan_to_num(abs_diff, nan=0.0).max(axis=0))
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # окно целиком из NaN
+                band_max = np.nanmax(abs_diff, axis=(1, 2))
+            band_max = np.nan_to_num(band_max, nan=0.0)
+            acc.max_diff = np.maximum(acc.max_diff, band_max)
+
+            acc.sum_squared_diff += np.nansum(arr_diff ** 2, axis=(1, 2))
+
+            if collect_stats:
+                if base_needs_mask:
+                    _apply_masks(arr_base, base_band_masks)
+                if test_needs_mask:
+                    _apply_masks(arr_test, test_band_masks)
+                base_acc.update(arr_base)
+                test_acc.update(arr_test)
+
+        if diff_ds is not None:
+            with profiling.timer(profile, "write"):
+                diff_ds.write(arr_diff.astype("float32"), window=window)
+
+        processed += 1
+        if on_window is not None:
+            on_window()
+
+    if profile is not None:
+        profile.add(windows=processed)
+    return acc, base_acc, test_acc
+
+
+# Счётчики, которые ``_diff_windows`` ведёт в профиле и которые задачи dask
+# возвращают вызывающему процессу. Время суммируется по всем процессам.
+_CHUNK_COUNTERS = ("windows", "blocks_decoded", "mapped_bytes", "read_time", "reduce_time", "write_time")
+
+
+class _DaskStopped(Exception):
+    """``stop`` сработал во время обхода dask-графом."""
+
+
+def _diff_chunk(
+    base_raster: str, test_raster: str, windows: list, env_options: dict, options: dict, open_options: dict,
+):
+    """Задача dask-графа: открыть растры в рабочем процессе и обойти свои окна.
+
+    Кроме частичных результатов возвращает счётчики чтения процесса — профиль
+    фазы живёт в вызывающем процессе.
+    """
+    profile = profiling.PhaseProfile("dask chunk")
+    with rasterio.Env(**{**env_options, "GDAL_CACHEMAX": GDAL_CACHEMAX_BYTES}), \
+            rasterio.open(base_raster, **open_options) as base_ds, \
+            rasterio.open(test_raster, **open_options) as test_ds:
+        parts = _diff_windows(base_ds, test_ds, windows, profile=profile, **options)
+    counters = {name: getattr(profile, name) for name in _CHUNK_COUNTERS}
+    return (*parts, counters)
+
+
+def _merge_parts(left: tuple, right: tuple) -> tuple:
+    acc, base_acc, test_acc, counters = left
+    acc.merge(right[0])
+    if base_acc is not None:
+        base_acc.merge(right[1])
+        test_acc.merge(right[2])
+    for name, value in right[3].items():
+        counters[name] += value
+    return left
+
+
+def _diff_dask(
+    base_raster: str,
+    test_raster: str,
+    windows: list,
+    options: dict,
+    *,
+    open_options: dict,
+    workers: int | None,
+    progress: Callable[[float], None] | None,
+    stop: Callable[[], bool] | None = None,
+) -> tuple | None:
+    """Обойти окна dask-графом на локальном планировщике процессов.
+
+    Окна делятся на куски (по нескольку на процесс, чтобы выровнять нагрузку),
+    каждый кусок — отдельная задача, а частичные результаты сливаются
+    попарным деревом. Память ограничена одним окном на процесс.
+
+    ``stop`` проверяется перед запуском каждой задачи: если он вернул True,
+    запущенные куски не дожидаются, а результат сливается из уже готовых
+    (None, если готовых нет).
+    """
+    import dask
+    from dask.callbacks import Callback
+
+    workers = workers or os.cpu_count() or 1
+    chunks = _split(windows, min(len(windows), workers * _DASK_CHUNKS_PER_WORKER))
+    env_options = _env_options()
+    parts = [
+        dask.delayed(_diff_chunk)(
+            base_raster, test_raster, chunk, env_options, options, open_options,
+            dask_key_name=f"diff-chunk-{i}",
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+    while len(parts) > 1:
+        merged = [dask.delayed(_merge_parts)(a, b) for a, b in zip(parts[::2], parts[1::2])]
+        parts = merged + parts[len(merged) * 2:]
+
+    class _Progress(Callback):
+        def __init__(self):
+            super().__init__()
+            self.finished = []
+
+        def _pretask(self, key, dsk, state):
+            if stop is not None and stop():
+                raise _DaskStopped
+
+        def _posttask(self, key, result, dsk, state, worker_id):
+            if str(key).startswith("diff-chunk-"):
+                self.finished.append(result)
+                if progress is not None:
+                    progress(len(self.finished) / len(chunks))
+
+    callback = _Progress()
+    # Свой пул вместо пула dask: при остановке его закрываем, не дожидаясь
+    # запущенных кусков. chunksize=1 — по одному куску на отправку, иначе
+    # dask сразу раздаёт процессам пачки задач и ``stop`` между кусками не
+    # проверяется.
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    stopped = False
+    try:
+        with callback:
+            (result,) = dask.compute(parts[0], scheduler="processes", pool=pool, chunksize=1)
+    except _DaskStopped:
+        stopped = True
+        if not callback.finished:
+            return None
+        return functools.reduce(_merge_parts, callback.finished)
+    finally:
+        pool.shutdown(wait=not stopped, cancel_futures=True)
+    return result
+
+
+def _dask_available() -> bool:
+    try:
+        import dask  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
 def calc_diff(
     base_raster: str,
     test_raster: str,
     *,
     rtol=0,
     atol=0,
+    max_ulps: int | None = None,
+    band_tolerances: dict[int, models.Tolerance] | None = None,
     equal_nan=True,
     diff_raster_path: str | None = None,
     collect_stats: bool = True,
     progress: Callable[[float], None] | None = None,
+    profile: profiling.PhaseProfile | None = None,
+    stop: Callable[[], bool] | None = None,
+    backend: str = "local",
+    workers: int | None = None,
+    open_options: dict | None = None,
+    labeler=None,
 ) -> tuple[list[models.PixelDiffStats], list[models.BandStats], list[models.BandStats]]:
     """Вычитать первый растр из второго для получения diff-a и его последующего анализа
     Сколько пикселей отличается, насколько они отличаются и т.п.
     Опционально выводить график (картинку) и возможность сохранения diff-a на диск
+
+    ``stop`` проверяется перед каждым окном; если он вернул True, результат
+    считается только по уже обработанным окнам.
+
+    ``backend="dask"`` распределяет окна по ``workers`` процессам через
+    dask (опциональная зависимость). Без установленного dask, а также при
+    сохранении diff-растра (в один GTiff из нескольких процессов не
+    записать) используется обычный обход в текущем процессе. В dask-режиме
+    ``stop`` проверяется между кусками окон, а не перед каждым окном.
+
+    ``open_options`` передаются драйверу при открытии обоих растров
+    (например, ``{"OVERVIEW_LEVEL": 0}`` — сравнить первый уровень обзоров).
+
+    Допуск ``atol``/``rtol``/``max_ulps`` общий для всех каналов, а
+    ``band_tolerances`` (номер канала с 1 -> ``models.Tolerance``) заменяет
+    его для отдельных каналов; номер вне растра — ``ValueError``. При
+    нулевом допуске каналы с одинаковыми типом и nodata сравниваются по
+    исходным значениям, без приведения к float64.
+
+    ``labeler`` (``regions.RegionLabeler``) размечает связные области
+    отличий по ходу обхода; с ним, как и с diff-растром, окна обходятся
+    только в текущем процессе.
     """
+    if backend not in ("local", "dask"):
+        raise ValueError(f"Unknown backend: {backend!r}")
+    open_options = open_options or {}
+    default_tolerance = models.Tolerance(atol=atol, rtol=rtol, max_ulps=max_ulps)
+    band_tolerances = band_tolerances or {}
+    options = {
+        "equal_nan": equal_nan,
+        "collect_stats": collect_stats,
+        # Смещения блоков обзоров могут указывать во внешний .ovr, а не в
+        # отображаемый файл — уровни обзоров читаются только через GDAL.
+        "raw_io": not open_options,
+    }
+
     with rasterio.Env(GDAL_CACHEMAX=GDAL_CACHEMAX_BYTES), \
-            rasterio.open(base_raster) as base_ds, \
-            rasterio.open(test_raster) as test_ds:
+            rasterio.open(base_raster, **open_options) as base_ds, \
+            rasterio.open(test_raster, **open_options) as test_ds:
         count = base_ds.count
         total_pixels = base_ds.width * base_ds.height
+        unknown = sorted(bidx for bidx in band_tolerances if not 1 <= bidx <= count)
+        if unknown:
+            raise UnknownBandError(f"Band tolerance given for band {unknown[0]}, but the raster has {count} band(s)")
+        options["tolerances"] = [band_tolerances.get(bidx, default_tolerance) for bidx in range(1, count + 1)]
+        # Обрабатываем растр окно за окном (по всем каналам сразу), чтобы не
+        # держать весь diff в памяти и читать каждый блок только один раз.
+        windows = [window for _, window in base_ds.block_windows(1)]
 
-        nd_base = base_ds.nodatavals
-        nd_test = test_ds.nodatavals
-
-        diff_count = np.zeros(count, dtype=np.int64)
-        valid_count = np.zeros(count, dtype=np.int64)
-        max_diff = np.zeros(count, dtype=np.float64)
-        sum_squared_diff = np.zeros(count, dtype=np.float64)
-        mask_diff_count = np.zeros(count, dtype=np.int64)
+        use_dask = backend == "dask" and diff_raster_path is None and labeler is None
+        if use_dask and not _dask_available():
+            warnings.warn("dask is not installed, falling back to the local backend", RuntimeWarning)
+            use_dask = False
 
-        compare_masks = any(
-            MaskFlags.per_dataset in flags
-            for flags in (*base_ds.mask_flag_enums, *test_ds.mask_flag_enums)
-        )
-        base_acc = _StatsAccumulator(count) if collect_stats else None
-        test_acc = _StatsAccumulator(count) if collect_stats else None
-        base_needs_mask = collect_stats and _needs_mask_read(base_ds)
-        test_needs_mask = collect_stats and _needs_mask_read(test_ds)
-
-        diff_ds = None
-        if diff_raster_path is not None:
-            diff_profile = base_ds.profile
-            diff_profile.update({
-                "dtype": "float32",
-                "nodata": float("nan"),
-                "compress": "deflate",
-                "predictor": 3,
-                "zlevel": 6,
-            })
-            Path(diff_raster_path).parent.mkdir(parents=True, exist_ok=True)
-            diff_ds = rasterio.open(diff_raster_path, "w", **diff_profile)
-
-        try:
-            # Обрабатываем растр окно за окном (по всем каналам сразу), чтобы не
-            # держать весь diff в памяти и читать каждый блок только один раз.
-            windows = [window for _, window in base_ds.block_windows(1)]
-            for done, window in enumerate(windows, start=1):
-                arr_base = base_ds.read(window=window).astype("float64")
-                arr_test = test_ds.read(window=window).astype("float64")
+        if use_dask:
+            result = None
+            if stop is None or not stop():
+                result = _diff_dask(
+                    base_raster,
+                    test_raster,
+                    windows,
+                    options,
+                    open_options=open_options,
+                    workers=workers,
+                    progress=progress,
+                    stop=stop,
+                )
+            if result is None:
+                acc, base_acc, test_acc = _DiffAccumulator(count), None, None
+            else:
+                acc, base_acc, test_acc, counters = result
+                if profile is not None:
+                    profile.add(**counters)
+        else:
+            diff_ds = None
+            if diff_raster_path is not None:
+                diff_profile = base_ds.profile
+                diff_profile.update({
+                    "dtype": "float32",
+                    "nodata": float("nan"),
+                    "compress": "deflate",
+                    "predictor": 3,
+                    "zlevel": 6,
+                })
+                Path(diff_raster_path).parent.mkdir(parents=True, exist_ok=True)
+                diff_ds = rasterio.open(diff_raster_path, "w", **diff_profile)
+            try:
+                acc, base_acc, test_acc = _diff_windows(
+                    base_ds,
+                    test_ds,
+                    windows,
+                    diff_ds=diff_ds,
+                    labeler=labeler,
+                    on_window=_WindowCounter(len(windows), progress),
+                    profile=profile,
+                    stop=stop,
+                    **options,
+                )
+            finally:
+                if diff_ds is not None:
+                    diff_ds.close()
 
-                _mask_nodata(arr_base, nd_base)
-                _mask_nodata(arr_test, nd_test)
+        pixel_stats = acc.result(total_pixels)
+        base_stats = base_acc.result() if base_acc is not None else []
+        test_stats = test_acc.result() if test_acc is not None else []
+        return pixel_stats, base_stats, test_stats
 
-                arr_diff = arr_base - arr_test
-                finite_mask = np.isfinite(arr_diff)
-                valid_count += np.count_nonzero(finite_mask, axis=(1, 2))
 
-                if diff_ds is not None:
-                    diff_ds.write(arr_diff.astype("float32"), window=window)
-
-                base_masks = test_masks = None
-                if compare_masks or base_needs_mask:
-                    base_masks = base_ds.read_masks(window=window)
-                if compare_masks or test_needs_mask:
-                    test_masks = test_ds.read_masks(window=window)
-                if compare_masks:
-                    mask_diff_count += np.count_nonzero(base_masks != test_masks, axis=(1, 2))
-
-                close_mask = np.isclose(arr_base, arr_test, rtol=rtol, atol=atol, equal_nan=equal_nan)
-                diff_count += np.count_nonzero(~close_mask, axis=(1, 2))
-
-                abs_diff = np.abs(arr_diff)
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore", RuntimeWarning)  # окно целиком из NaN
-                    band_max = np.nanmax(abs_diff, axis=(1, 2))
-                band_max = np.nan_to_num(band_max, nan=0.0)
-                max_diff = np.maximum(max_diff, band_max)
-
-                sum_squared_diff += np.nansum(arr_diff ** 2, axis=(1, 2))
-
-                if collect_stats:
-                    if base_needs_mask:
-                        arr_base[base_masks == 0] = np.nan
-                    if test_needs_mask:
-                        arr_test[test_masks == 0] = np.nan
-                    base_acc.update(arr_base)
-                    test_acc.update(arr_test)
+def calc_overview_diffs(
+    base_raster: str,
+    test_raster: str,
+    base_factors: list[int],
+    test_factors: list[int],
+    *,
+    atol: float = 0.0,
+    rtol: float = 0.0,
+    max_ulps: int | None = None,
+    band_tolerances: dict[int, models.Tolerance] | None = None,
+    progress: Callable[[float], None] | None = None,
+    profile: profiling.PhaseProfile | None = None,
+    stop: Callable[[], bool] | None = None,
+    backend: str = "local",
+    workers: int | None = None,
+) -> list[models.OverviewPixelDiff]:
+    """Попиксельно сравнить совпадающие уровни обзоров.
 
-                if progress is not None:
-                    progress(done / len(windows))
-        finally:
-            if diff_ds is not None:
-                diff_ds.close()
+    Уровни сопоставляются по порядку, пока коэффициенты уменьшения
+    (``ds.overviews(1)``) совпадают. Каждый уровень открывается с
+    ``OVERVIEW_LEVEL`` и проходит тот же ``calc_diff``, что и полное
+    разрешение, но без статистики. Уровни с разной формой массива попиксельно
+    не сравниваются (``pixel_values=None``).
+    """
+    levels = []
+    for base_factor, test_factor in zip(base_factors, test_factors):
+        if base_factor != test_factor:
+            break
+        levels.append(base_factor)
 
-        pixel_stats = [
-            models.PixelDiffStats(
-                diff_count=int(diff_count[b]),
-                total_count=total_pixels,
-                diff_percent=float((diff_count[b] / total_pixels) * 100),
-                max_diff=float(max_diff[b]),
-                rmse=float(np.sqrt(sum_squared_diff[b] / valid_count[b])) if valid_count[b] else 0.0,
-                mask_diff_count=int(mask_diff_count[b]),
+    results = []
+    for level, factor in enumerate(levels):
+        if stop is not None and stop():
+            break
+        open_options = {"OVERVIEW_LEVEL": level}
+        with rasterio.open(base_raster, **open_options) as base_ds, \
+                rasterio.open(test_raster, **open_options) as test_ds:
+            compatible = base_ds.shape == test_ds.shape and base_ds.count == test_ds.count
+        pixel_values = None
+        if compatible:
+            pixel_values, _, _ = calc_diff(
+                base_raster,
+                test_raster,
+                atol=atol,
+                rtol=rtol,
+                max_ulps=max_ulps,
+                band_tolerances=band_tolerances,
+                collect_stats=False,
+                profile=profile,
+                stop=stop,
+                backend=backend,
+                workers=workers,
+                open_options=open_options,
             )
-            for b in range(count)
-        ]
-        base_stats = base_acc.result() if collect_stats else []
-        test_stats = test_acc.result() if collect_stats else []
-        return pixel_stats, base_stats, test_stats
+        results.append(models.OverviewPixelDiff(level=level, factor=factor, pixel_values=pixel_values))
+        if progress is not None:
+            progress((level + 1) / len(levels))
+    return results
 
 
 def _phase(
@@ -299,6 +975,137 @@ def _phase(
     return lambda complete: progress(complete, message)
 
 
+def _profiled(profiler: profiling.Profiler | None, name: str):
+    return profiler.phase(name) if profiler is not None else contextlib.nullcontext()
+
+
+def _calc_stats_pair(
+    base_raster: str,
+    test_raster: str,
+    *,
+    approx: bool,
+    progress: Callable[[float], None] | None,
+    profiler: profiling.Profiler | None = None,
+    stop: Callable[[], bool] | None = None,
+) -> tuple[list[models.BandStats], list[models.BandStats]]:
+    """Посчитать статистику обоих растров одновременно.
+
+    Прогресс сводится в одну шкалу — среднее по двум растрам.
+    """
+    done = [0.0, 0.0]
+    lock = threading.Lock()
+
+    def track(idx: int) -> Callable[[float], None] | None:
+        if progress is None:
+            return None
+
+        def update(complete: float) -> None:
+            with lock:
+                done[idx] = complete
+                progress(sum(done) / 2)
+        return update
+
+    # Потоки внутри calc_stats делим между двумя растрами поровну.
+    workers = max(1, STATS_WORKERS // 2)
+    env_options = _env_options()
+
+    def run(raster_path: str, idx: int) -> list[models.BandStats]:
+        with rasterio.Env(**env_options), \
+                _profiled(profiler, ("stats base", "stats test")[idx]) as profile:
+            return calc_stats(
+                raster_path, track(idx), workers=workers, approx=approx, profile=profile, stop=stop,
+            )
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        base_future = pool.submit(run, base_raster, 0)
+        test_future = pool.submit(run, test_raster, 1)
+        return base_future.result(), test_future.result()
+
+
+def _compare_subdataset(base_name: str, test_name: str, env_options: dict, kwargs: dict):
+    with rasterio.Env(**env_options):
+        return compare_rasters(base_name, test_name, checksum=False, **kwargs)
+
+
+def compare_subdatasets(
+    base_raster: str,
+    test_raster: str,
+    *,
+    workers: int | None = None,
+    progress: Callable[[float], None] | None = None,
+    on_report: Callable[[str, models.RasterDiff], None] | None = None,
+    stop: Callable[[], bool] | None = None,
+    **kwargs,
+) -> models.SubdatasetsDiff:
+    """Сравнить подсеты (переменные NetCDF/HDF и т.п.) двух контейнеров.
+
+    Подсеты сопоставляются по ``subdataset_key``, каждая пара проходит полный
+    ``compare_rasters`` (без контрольной суммы — у подсета нет своего файла) в
+    отдельном процессе пула из ``workers`` процессов. ``kwargs`` передаются в
+    ``compare_rasters`` и должны сериализоваться для передачи в процесс.
+    ``on_report(ключ, отчёт)`` вызывается по мере готовности каждой пары.
+
+    ``stop`` проверяется, пока пул занят: если он вернул True, ещё не
+    начатые пары отменяются, а в ``reports`` остаются только готовые.
+    """
+    with rasterio.open(base_raster) as ds:
+        base_names = {subdataset_key(name, base_raster): name for name in ds.subdatasets}
+    with rasterio.open(test_raster) as ds:
+        test_names = {subdataset_key(name, test_raster): name for name in ds.subdatasets}
+
+    pairs = [key for key in base_names if key in test_names]
+    reports: dict[str, models.RasterDiff] = {}
+    if pairs:
+        env_options = _env_options()
+        # Не fork: вызывающий процесс может быть многопоточным (aio, пул
+        # статистики) с открытыми дескрипторами GDAL, а fork из такого
+        # процесса может зависнуть в дочернем.
+        pool = ProcessPoolExecutor(
+            max_workers=min(workers or os.cpu_count() or 1, len(pairs)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        stopped = False
+        try:
+            futures = {
+                pool.submit(_compare_subdataset, base_names[key], test_names[key], env_options, kwargs): key
+                for key in pairs
+            }
+            pending = set(futures)
+            while pending:
+                if stop is not None and stop():
+                    stopped = True
+                    break
+                done, pending = wait(pending, timeout=_SUBDATASET_STOP_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = futures[future]
+                    reports[key] = future.result()
+                    if on_report is not None:
+                        on_report(key, reports[key])
+                    if progress is not None:
+                        progress(len(reports) / len(pairs))
+        finally:
+            # После остановки не ждём уже запущенные пары: отчёт и так неполный.
+            pool.shutdown(wait=not stopped, cancel_futures=True)
+
+    return models.SubdatasetsDiff(
+        equal=list(base_names) == list(test_names),
+        base=list(base_names),
+        test=list(test_names),
+        reports={key: reports[key] for key in pairs if key in reports},
+    )
+
+
+def _diff_field(cls, base, test, *, compact: bool, equal: bool | None = None):
+    """Поле отчёта ``cls(equal, base, test)``; в компактном режиме совпадающее
+    поле сворачивается в ``models.DiffSame`` с отпечатком значения.
+    """
+    if equal is None:
+        equal = base == test
+    if compact and equal:
+        return models.DiffSame(digest=hashlib.blake2b(repr(base).encode(), digest_size=16).hexdigest())
+    return cls(equal=equal, base=base, test=test)
+
+
 def compare_rasters(
     base_raster: str,
     test_raster: str,
@@ -306,151 +1113,198 @@ def compare_rasters(
     diff_raster_path: str | None = None,
     ignore_pixel_values: bool = False,
     ignore_stats: bool = False,
+    approx_stats: bool = False,
     progress: Callable[[float, str], None] | None = None,
+    profiler: profiling.Profiler | None = None,
+    stop: Callable[[], bool] | None = None,
+    backend: str = "local",
+    workers: int | None = None,
+    checksum: bool = True,
+    with_subdatasets: bool = False,
+    compare_overviews: bool = False,
+    atol: float = 0.0,
+    rtol: float = 0.0,
+    max_ulps: int | None = None,
+    band_tolerances: dict[int, models.Tolerance] | None = None,
+    collect_regions: bool = False,
+    max_regions: int | None = None,
+    compact: bool = False,
+    on_pixel_values: Callable[[list[models.PixelDiffStats]], None] | None = None,
+    on_subdataset: Callable[[str, models.RasterDiff], None] | None = None,
 ) -> models.RasterDiff | None:
-    base_md5 = utils.calc_hash(base_raster, progress=_phase(progress, "Hashing base raster"))
-    test_md5 = utils.calc_hash(test_raster, progress=_phase(progress, "Hashing test raster"))
+    """Сравнить два растра. Возвращает None, если файлы побайтно одинаковы.
+
+    ``stop`` — кооперативная остановка: проверяется между блоками хеширования
+    и окнами растра. Если он сработал, оставшиеся фазы пропускаются или
+    обрываются, а отчёт возвращается частичным с ``complete=False``.
+
+    ``backend``/``workers`` выбирают исполнение попиксельного прохода
+    (см. ``calc_diff``). ``checksum=False`` отключает хеширование файлов (и
+    ранний выход для побайтно одинаковых). ``with_subdatasets=True``
+    дополнительно сравнивает подсеты контейнеров в ``workers`` процессах
+    (см. ``compare_subdatasets``). ``compare_overviews=True`` дополнительно
+    сравнивает попиксельно совпадающие уровни обзоров (см.
+    ``calc_overview_diffs``).
+
+    ``atol``/``rtol``/``max_ulps`` и поканальные ``band_tolerances`` задают
+    допуск попиксельного сравнения (см. ``calc_diff``).
+
+    ``collect_regions=True`` выделяет связные области отличающихся пикселей
+    (нужен scipy) и оставляет ``max_regions`` крупнейших (см.
+    ``regions.RegionLabeler``).
+
+    ``compact=True`` — отчёт для массовых прогонов: совпадающие поля хранят
+    только отпечаток значения (``models.DiffSame``) вместо копий base и test.
 
-    if base_md5 == test_md5:
+    ``on_pixel_values`` и ``on_subdataset`` получают результаты по мере
+    готовности, не дожидаясь остальных фаз: попиксельное сравнение — сразу
+    после прохода по окнам, отчёт подсета — как только он посчитан.
+    """
+    tolerance = {"atol": atol, "rtol": rtol, "max_ulps": max_ulps, "band_tolerances": band_tolerances}
+    interrupted = False
+
+    def should_stop() -> bool:
+        nonlocal interrupted
+        if not interrupted and stop():
+            interrupted = True
+        return interrupted
+
+    check = should_stop if stop is not None else None
+
+    base_md5 = test_md5 = ""
+    if checksum:
+        with _profiled(profiler, "hash base") as profile:
+            base_md5 = utils.calc_hash(
+                base_raster, progress=_phase(progress, "Hashing base raster"), profile=profile, stop=check,
+            )
+        with _profiled(profiler, "hash test") as profile:
+            test_md5 = utils.calc_hash(
+                test_raster, progress=_phase(progress, "Hashing test raster"), profile=profile, stop=check,
+            )
+
+    hashed = checksum and not interrupted
+    if not hashed:
+        # Хеш недочитанного файла ни о чём не говорит.
+        base_md5 = test_md5 = ""
+    elif base_md5 == test_md5:
         return None
 
     # Отключаем GDAL PAM, чтобы чтение и запись растров не создавали
     # сайдкар-файлы <растр>.aux.xml рядом с входными данными.
     with rasterio.Env(GDAL_PAM_ENABLED="NO"):
-        base_props = read_raster_props(base_raster)
-        test_props = read_raster_props(test_raster)
+        with _profiled(profiler, "props"):
+            base_props = read_raster_props(base_raster)
+            test_props = read_raster_props(test_raster)
 
         pixel_values = None
         base_stats: list[models.BandStats] = []
         test_stats: list[models.BandStats] = []
-        need_pixel_diff = not ignore_pixel_values or diff_raster_path is not None
-        if need_pixel_diff and is_compatible_rasters(base_raster, test_raster):
-            pixel_values, base_stats, test_stats = calc_diff(
+        need_pixel_diff = not ignore_pixel_values or diff_raster_path is not None or collect_regions
+        labeler = None
+        if not base_props.bands and not test_props.bands:
+            # Контейнеры подсетов: собственных пикселей нет, сравнивать нечего.
+            pixel_values = []
+        # Если остановка сработала ещё на хешировании, пиксели уже не читаем.
+        elif need_pixel_diff and not interrupted and is_compatible_rasters(base_raster, test_raster):
+            if collect_regions:
+                labeler = regions.RegionLabeler(max_regions)
+            with _profiled(profiler, "pixels") as profile:
+                pixel_values, base_stats, test_stats = calc_diff(
+                    base_raster,
+                    test_raster,
+                    diff_raster_path=diff_raster_path,
+                    collect_stats=not ignore_stats,
+                    labeler=labeler,
+                    **tolerance,
+                    progress=_phase(progress, "Comparing pixels"),
+                    profile=profile,
+                    stop=check,
+                    backend=backend,
+                    workers=workers,
+                )
+            if on_pixel_values is not None:
+                on_pixel_values(pixel_values)
+        elif not ignore_stats and not interrupted:
+            base_stats, test_stats = _calc_stats_pair(
                 base_raster,
                 test_raster,
-                diff_raster_path=diff_raster_path,
-                collect_stats=not ignore_stats,
-                progress=_phase(progress, "Comparing pixels"),
+                approx=approx_stats,
+                progress=_phase(progress, "Computing statistics"),
+                profiler=profiler,
+                stop=check,
             )
-        elif not ignore_stats:
-            base_stats = calc_stats(base_raster, progress=_phase(progress, "Computing base statistics"))
-            test_stats = calc_stats(test_raster, progress=_phase(progress, "Computing test statistics"))
+
+        change_regions = None
+        if labeler is not None:
+            with _profiled(profiler, "regions"):
+                change_regions = labeler.result(base_props.transform)
+
+        overview_values = None
+        if compare_overviews and base_props.bands and not interrupted \
+                and is_compatible_rasters(base_raster, test_raster):
+            with _profiled(profiler, "overviews") as profile:
+                overview_values = calc_overview_diffs(
+                    base_raster,
+                    test_raster,
+                    base_props.overviews[0],
+                    test_props.overviews[0],
+                    **tolerance,
+                    progress=_phase(progress, "Comparing overviews"),
+                    profile=profile,
+                    stop=check,
+                    backend=backend,
+                    workers=workers,
+                )
+
+    subdatasets = None
+    if with_subdatasets and not interrupted:
+        subdatasets = compare_subdatasets(
+            base_raster,
+            test_raster,
+            workers=workers,
+            progress=_phase(progress, "Comparing subdatasets"),
+            on_report=on_subdataset,
+            stop=check,
+            ignore_pixel_values=ignore_pixel_values,
+            ignore_stats=ignore_stats,
+            approx_stats=approx_stats,
+            compact=compact,
+            **tolerance,
+        )
+
+    def field(cls, base, test, equal: bool | None = None):
+        return _diff_field(cls, base, test, compact=compact, equal=equal)
+
+    def prop(cls, name: str, equal: bool | None = None):
+        return field(cls, getattr(base_props, name), getattr(test_props, name), equal)
 
     return models.RasterDiff(
-        checksum=models.DiffStr(
-            equal=base_md5 == test_md5,
-            base=base_md5,
-            test=test_md5,
-        ),
-        bands=models.DiffInt(
-            equal=base_props.bands == test_props.bands,
-            base=base_props.bands,
-            test=test_props.bands,
-        ),
-        width=models.DiffInt(
-            equal=base_props.width == test_props.width,
-            base=base_props.width,
-            test=test_props.width,
-        ),
-        height=models.DiffInt(
-            equal=base_props.height == test_props.height,
-            base=base_props.height,
-            test=test_props.height,
-        ),
-        dtype=models.DiffStr(
-            equal=base_props.dtype == test_props.dtype,
-            base=base_props.dtype,
-            test=test_props.dtype,
-        ),
-        nodata=models.DiffTuple(
-            equal=_nodata_equal(base_props.nodata, test_props.nodata),
-            base=base_props.nodata,
-            test=test_props.nodata,
-        ),
-        bbox=models.DiffBbox(
-            equal=base_props.bbox == test_props.bbox,
-            base=base_props.bbox,
-            test=test_props.bbox,
-        ),
-        crs=models.DiffCRS(
-            equal=base_props.crs == test_props.crs,
-            base=base_props.crs,
-            test=test_props.crs,
-        ),
-        transform=models.DiffTransform(
-            equal=base_props.transform == test_props.transform,
-            base=base_props.transform,
-            test=test_props.transform,
-        ),
-        gcps=models.DiffDict(
-            equal=base_props.gcps == test_props.gcps,
-            base=base_props.gcps,
-            test=test_props.gcps,
-        ),
-        rpcs=models.DiffOptionalDict(
-            equal=base_props.rpcs == test_props.rpcs,
-            base=base_props.rpcs,
-            test=test_props.rpcs,
-        ),
-        scales=models.DiffTuple(
-            equal=base_props.scales == test_props.scales,
-            base=base_props.scales,
-            test=test_props.scales,
-        ),
-        offsets=models.DiffTuple(
-            equal=base_props.offsets == test_props.offsets,
-            base=base_props.offsets,
-            test=test_props.offsets,
-        ),
-        units=models.DiffTuple(
-            equal=base_props.units == test_props.units,
-            base=base_props.units,
-            test=test_props.units,
-        ),
-        colorinterp=models.DiffTuple(
-            equal=base_props.colorinterp == test_props.colorinterp,
-            base=base_props.colorinterp,
-            test=test_props.colorinterp,
-        ),
-        descriptions=models.DiffTuple(
-            equal=base_props.descriptions == test_props.descriptions,
-            base=base_props.descriptions,
-            test=test_props.descriptions,
-        ),
-        colormap=models.DiffList(
-            equal=base_props.colormap == test_props.colormap,
-            base=base_props.colormap,
-            test=test_props.colormap,
-        ),
-        mask_flags=models.DiffList(
-            equal=base_props.mask_flags == test_props.mask_flags,
-            base=base_props.mask_flags,
-            test=test_props.mask_flags,
-        ),
-        overviews=models.DiffList(
-            equal=base_props.overviews == test_props.overviews,
-            base=base_props.overviews,
-            test=test_props.overviews,
-        ),
-        image_structure=models.DiffDict(
-            equal=base_props.image_structure == test_props.image_structure,
-            base=base_props.image_structure,
-            test=test_props.image_structure,
-        ),
-        metadata=models.DiffDict(
-            equal=base_props.metadata == test_props.metadata,
-            base=base_props.metadata,
-            test=test_props.metadata,
-        ),
-        bands_metadata=models.DiffList(
-            equal=base_props.bands_metadata == test_props.bands_metadata,
-            base=base_props.bands_metadata,
-            test=test_props.bands_metadata,
-        ),
-        stats=models.DiffList(
-            equal=base_stats == test_stats,
-            base=base_stats,
-            test=test_stats,
-        ),
+        checksum=field(models.DiffStr, base_md5, test_md5, equal=base_md5 == test_md5 if hashed else not checksum),
+        bands=prop(models.DiffInt, "bands"),
+        width=prop(models.DiffInt, "width"),
+        height=prop(models.DiffInt, "height"),
+        dtype=prop(models.DiffStr, "dtype"),
+        nodata=prop(models.DiffTuple, "nodata", equal=_nodata_equal(base_props.nodata, test_props.nodata)),
+        bbox=prop(models.DiffBbox, "bbox"),
+        crs=prop(models.DiffCRS, "crs"),
+        transform=prop(models.DiffTransform, "transform"),
+        gcps=prop(models.DiffDict, "gcps"),
+        rpcs=prop(models.DiffOptionalDict, "rpcs"),
+        scales=prop(models.DiffTuple, "scales"),
+        offsets=prop(models.DiffTuple, "offsets"),
+        units=prop(models.DiffTuple, "units"),
+        colorinterp=prop(models.DiffTuple, "colorinterp"),
+        descriptions=prop(models.DiffTuple, "descriptions"),
+        colormap=prop(models.DiffList, "colormap"),
+        mask_flags=prop(models.DiffList, "mask_flags"),
+        overviews=prop(models.DiffList, "overviews"),
+        image_structure=prop(models.DiffDict, "image_structure"),
+        metadata=prop(models.DiffDict, "metadata"),
+        bands_metadata=prop(models.DiffList, "bands_metadata"),
+        stats=field(models.DiffList, base_stats, test_stats),
         pixel_values=pixel_values,
+        overview_values=overview_values,
+        regions=change_regions,
+        complete=not interrupted,
+        subdatasets=subdatasets,
     )
@@ -6,7 +6,7 @@ from rasterio.coords import BoundingBox
 from rasterio.crs import CRS
 
 
-@dataclass
+@dataclass(slots=True)
 class RasterProps:
     width: int
     height: int
@@ -31,70 +31,83 @@ class RasterProps:
     bands_metadata: list
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffStr:
     equal: bool
     base: str
     test: str
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffInt:
     equal: bool
     base: int
     test: int
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffTuple:
     equal: bool
     base: tuple
     test: tuple
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffList:
     equal: bool
     base: list
     test: list
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffDict:
     equal: bool
     base: dict
     test: dict
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffOptionalDict:
     equal: bool
     base: dict | None
     test: dict | None
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffBbox:
     equal: bool
     base: BoundingBox
     test: BoundingBox
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffCRS:
     equal: bool
     base: CRS
     test: CRS
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffTransform:
     equal: bool
     base: Affine
     test: Affine
 
 
-@dataclass
+@dataclass(slots=True)
+class DiffSame:
+    """Совпадающее поле компактного отчёта (``compare_rasters(compact=True)``).
+
+    Вместо копий значений хранится только их отпечаток (blake2b от repr),
+    по которому можно сверить отчёты между собой.
+    """
+    digest: str
+    equal: bool = True
+    base: None = None
+    test: None = None
+
+
+@dataclass(slots=True)
 class BandStats:
     min: float | None
     max: float | None
@@ -102,7 +115,24 @@ class BandStats:
     std: float | None
 
 
-@dataclass
+@dataclass(slots=True)
+class Tolerance:
+    """Допуск попиксельного сравнения канала.
+
+    Пиксели равны, если ``|base - test| <= atol + rtol * |test|`` или (для
+    вещественных каналов) между ними не больше ``max_ulps`` представимых
+    чисел; для целочисленных каналов ``max_ulps`` — число шагов значения.
+    """
+    atol: float = 0.0
+    rtol: float = 0.0
+    max_ulps: int | None = None
+
+    @property
+    def exact(self) -> bool:
+        return self.atol == 0 and self.rtol == 0 and not self.max_ulps
+
+
+@dataclass(slots=True)
 class PixelDiffStats:
     diff_count: int
     total_count: int
@@ -112,8 +142,34 @@ class PixelDiffStats:
     mask_diff_count: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
+class ChangeRegion:
+    """Связная область отличающихся пикселей (координаты — в CRS растра)."""
+    count: int
+    bbox: tuple[float, float, float, float]  # left, bottom, right, top
+    centroid: tuple[float, float]
+    max_diff: float
+    mean_diff: float
+
+
+@dataclass(slots=True)
+class ChangeRegions:
+    """Крупнейшие области и общее число найденных."""
+    total_count: int
+    regions: list[ChangeRegion]
+
+
+@dataclass(slots=True)
+class OverviewPixelDiff:
+    """Попиксельное сравнение одного уровня обзоров."""
+    level: int
+    factor: int
+    pixel_values: list[PixelDiffStats] | None
+
+
+@dataclass(slots=True)
 class RasterDiff:
+    # В компактном отчёте совпадающие поля Diff* заменены на DiffSame.
     checksum: DiffStr
     bands: DiffInt
     width: DiffInt
@@ -138,3 +194,20 @@ class RasterDiff:
     bands_metadata: DiffList
     stats: DiffList
     pixel_values: list[PixelDiffStats] | None
+    # False, если сравнение остановлено досрочно (см. ``stop`` в compare_rasters):
+    # попиксельные результаты и статистика тогда посчитаны по части окон.
+    complete: bool = True
+    subdatasets: "SubdatasetsDiff | None" = None
+    # Попиксельное сравнение уровней обзоров (None, если не запрошено).
+    overview_values: list[OverviewPixelDiff] | None = None
+    # Связные области отличий (None, если не запрошены).
+    regions: ChangeRegions | None = None
+
+
+@dataclass(slots=True)
+class SubdatasetsDiff:
+    """Подсеты контейнеров: ключи с обеих сторон и отчёты по парам."""
+    equal: bool
+    base: list[str]
+    test: list[str]
+    reports: dict[str, RasterDiff]
@@ -0,0 +1,176 @@
+"""Инструментирование фаз сравнения.
+
+``Profiler`` передаётся в ``compare_rasters`` (и ниже — в ``calc_diff``,
+``calc_stats``, ``calc_hash``) и собирает по каждой фазе: время по часам и
+CPU, объём прочитанного, число обработанных окон и декодированных через
+GDAL блоков, объём окон, отданных из memory map (``rawio``), пик RSS
+фазы, а внутри цикла по окнам — раздельно время чтения,
+редукций numpy и записи diff-растра. Этого хватает, чтобы понять, во что
+упирается сравнение — в декодирование, I/O или вычисления.
+
+Окна из memory map не проходят через ``read()``: их объём в ``bytes_read``
+не попадает и учитывается отдельно в ``mapped_bytes``, а подкачка страниц
+происходит при первом обращении к данным и поэтому входит во время
+редукций, а не чтения.
+
+``peak_rss`` на Linux — ``VmHWM`` из ``/proc/self/status``, сброшенный в
+начале фазы записью ``5`` в ``/proc/self/clear_refs``, то есть пик именно
+этой фазы. Где сброс недоступен, это ``ru_maxrss`` — пик за всё время жизни
+процесса, который только растёт от фазы к фазе.
+
+Счётчики I/O, CPU и RSS общие на процесс: у фаз, идущих параллельно
+(статистика base и test), они пересекаются, а начало второй фазы сбрасывает
+пик RSS и для первой.
+"""
+
+import contextlib
+import dataclasses
+import json
+import sys
+import threading
+import time
+from collections.abc import Iterator
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_PROC_IO = "/proc/self/io"
+_PROC_STATUS = "/proc/self/status"
+_PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _io_counters() -> dict[str, int] | None:
+    """Счётчики чтения процесса из ``/proc/self/io`` (только Linux).
+
+    ``rchar`` — байты, запрошенные у ОС (включая попадания в page cache),
+    ``read_bytes`` — байты, реально прочитанные с устройства.
+    """
+    try:
+        with open(_PROC_IO) as file:
+            counters = dict(line.split(": ") for line in file.read().splitlines())
+    except OSError:
+        return None
+    return {"rchar": int(counters["rchar"]), "read_bytes": int(counters["read_bytes"])}
+
+
+def _reset_peak_rss() -> bool:
+    """Сбросить пик RSS процесса (``VmHWM``); False, если ядро этого не умеет."""
+    try:
+        with open(_PROC_CLEAR_REFS, "w") as file:
+            file.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss_bytes(reset: bool) -> int | None:
+    """Пик RSS с момента ``_reset_peak_rss`` или, если сброса не было, за всю жизнь процесса."""
+    if reset:
+        try:
+            with open(_PROC_STATUS) as file:
+                for line in file:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@dataclasses.dataclass
+class PhaseProfile:
+    name: str
+    wall: float = 0.0
+    cpu: float = 0.0
+    bytes_read: int | None = None
+    disk_bytes_read: int | None = None
+    windows: int = 0
+    blocks_decoded: int = 0
+    mapped_bytes: int = 0
+    peak_rss: int | None = None
+    read_time: float = 0.0
+    reduce_time: float = 0.0
+    write_time: float = 0.0
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def add(self, **deltas) -> None:
+        """Потокобезопасно прибавить значения к счётчикам фазы."""
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    @contextlib.contextmanager
+    def timer(self, kind: str) -> Iterator[None]:
+        """Прибавить длительность блока к ``<kind>_time`` (read/reduce/write)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(**{f"{kind}_time": time.perf_counter() - start})
+
+
+def timer(profile: PhaseProfile | None, kind: str):
+    """``profile.timer(kind)`` или пустой контекст, если профилирование выключено."""
+    return profile.timer(kind) if profile is not None else contextlib.nullcontext()
+
+
+class Profiler:
+    def __init__(self):
+        self.phases: list[PhaseProfile] = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[PhaseProfile]:
+        record = PhaseProfile(name)
+        io_start = _io_counters()
+        reset = _reset_peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall = time.perf_counter() - wall_start
+            record.cpu = time.process_time() - cpu_start
+            io_end = _io_counters()
+            if io_start is not None and io_end is not None:
+                # Там, где объём известен точно (хеширование), он уже записан.
+                if record.bytes_read is None:
+                    record.bytes_read = io_end["rchar"] - io_start["rchar"]
+                record.disk_bytes_read = io_end["read_bytes"] - io_start["read_bytes"]
+            record.peak_rss = _peak_rss_bytes(reset)
+            with self._lock:
+                self.phases.append(record)
+
+    def to_dict(self) -> dict:
+        return {"phases": [
+            {field.name: getattr(record, field.name) for field in dataclasses.fields(record)}
+            for record in self.phases
+        ]}
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+            file.write("\n")
+
+    def format_table(self) -> str:
+        def mib(value: int | None) -> str:
+            return "-" if value is None else f"{value / 2 ** 20:.1f}"
+
+        header = (
+            f"{'phase':<16} {'wall s':>8} {'cpu s':>8} {'read MiB':>9} {'disk MiB':>9} "
+            f"{'windows':>8} {'blocks':>8} {'mmap MiB':>9} {'read s':>8} {'numpy s':>8} {'write s':>8} {'peak RSS MiB':>12}"
+        )
+        rows = [header]
+        for record in self.phases:
+            rows.append(
+                f"{record.name:<16} {record.wall:>8.3f} {record.cpu:>8.3f} "
+                f"{mib(record.bytes_read):>9} {mib(record.disk_bytes_read):>9} "
+                f"{record.windows:>8} {record.blocks_decoded:>8} {mib(record.mapped_bytes):>9} {record.read_time:>8.3f} "
+                f"{record.reduce_time:>8.3f} {record.write_time:>8.3f} {mib(record.peak_rss):>12}"
+            )
+        return "\n".join(rows)
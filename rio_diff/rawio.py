@@ -0,0 +1,143 @@
+"""Чтение несжатых растров без GDAL: окна как представления memory map.
+
+Для несжатых GeoTIFF и ENVI ``ds.read`` по сути копирует байты файла в
+новый массив на каждое окно. Здесь файл отображается в память
+(``numpy.memmap``), а окно отдаётся как представление поверх отображения:
+декодирования и копии в буфер GDAL нет, повторные сравнения читаются прямо
+из page cache. Копии остаются у вызывающего (приведение к float64) и у
+GTiff с раскладкой по каналам, где каналы окна склеиваются из разных блоков.
+
+Быстрый путь включается только там, где раскладка известна точно:
+
+- GTiff без сжатия и NBITS, окно совпадает с блоком этого файла; смещение
+  блока берётся из тега ``BLOCK_OFFSET_<x>_<y>`` домена ``TIFF``, порядок
+  байтов — из заголовка (``II``/``MM``). Отсутствующие блоки (sparse-файлы)
+  и окна не по сетке блоков читаются обычным ``ds.read``.
+- ENVI: смещение, порядок байтов и interleave (bsq/bil/bip) из ``.hdr``;
+  любое окно — представление.
+
+Во всех остальных случаях ``reader`` возвращает None.
+"""
+
+import os
+
+import numpy as np
+
+_GTIFF_IMAGE_STRUCTURE_BLOCKERS = ("COMPRESSION", "NBITS")
+
+
+class _GTiffReader:
+    def __init__(self, ds, path: str):
+        self._ds = ds
+        with open(path, "rb") as file:
+            order = file.read(2)
+        byteorder = {b"II": "<", b"MM": ">"}[order]
+        self._dtype = np.dtype(ds.dtypes[0]).newbyteorder(byteorder)
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+        self._block_height, self._block_width = ds.block_shapes[0]
+        self._pixel_interleaved = ds.count == 1 or ds.interleaving.name == "pixel"
+
+    def _block(self, bidx: int, col: int, row: int, rows: int, samples: int) -> np.ndarray | None:
+        offset = self._ds.get_tag_item(f"BLOCK_OFFSET_{col}_{row}", "TIFF", bidx=bidx)
+        size = self._ds.get_tag_item(f"BLOCK_SIZE_{col}_{row}", "TIFF", bidx=bidx)
+        if not offset or not size:
+            return None  # блок не записан (sparse), GDAL вернёт nodata/0
+        shape = (rows, self._block_width, samples)
+        needed = int(np.prod(shape)) * self._dtype.itemsize
+        # Усечённый или повреждённый файл: ошибку сообщит GDAL.
+        if int(size) < needed or int(offset) + needed > self._data.size:
+            return None
+        return self._data[int(offset):int(offset) + needed].view(self._dtype).reshape(shape)
+
+    def read(self, window) -> np.ndarray | None:
+        row_off, col_off = int(window.row_off), int(window.col_off)
+        height, width = int(window.height), int(window.width)
+        if row_off % self._block_height or col_off % self._block_width:
+            return None
+        if height != min(self._block_height, self._ds.height - row_off) \
+                or width != min(self._block_width, self._ds.width - col_off):
+            return None
+        row, col = row_off // self._block_height, col_off // self._block_width
+        # Последняя полоса короче остальных, а краевой тайл полного размера,
+        # но его первые ``height`` строк — как раз данные окна.
+        rows = height
+
+        if self._pixel_interleaved:
+            block = self._block(1, col, row, rows, self._ds.count)
+            if block is None:
+                return None
+            return block[:height, :width].transpose(2, 0, 1)
+
+        bands = []
+        for bidx in range(1, self._ds.count + 1):
+            block = self._block(bidx, col, row, rows, 1)
+            if block is None:
+                return None
+            bands.append(block[:height, :width, 0])
+        # Каналы лежат в разных блоках файла — одно окно требует их склейки.
+        return bands[0][np.newaxis] if len(bands) == 1 else np.stack(bands)
+
+
+def _read_envi_header(path: str) -> dict[str, str]:
+    header = {}
+    with open(path) as file:
+        for line in file:
+            key, sep, value = line.partition("=")
+            if sep:
+                header[key.strip().lower()] = value.strip()
+    return header
+
+
+class _EnviReader:
+    def __init__(self, ds, path: str, header: dict[str, str]):
+        byteorder = ">" if header.get("byte order", "0") == "1" else "<"
+        dtype = np.dtype(ds.dtypes[0]).newbyteorder(byteorder)
+        interleave = header.get("interleave", "bsq").lower()
+        shape, axes = {
+            "bsq": ((ds.count, ds.height, ds.width), (0, 1, 2)),
+            "bil": ((ds.height, ds.count, ds.width), (1, 0, 2)),
+            "bip": ((ds.height, ds.width, ds.count), (2, 0, 1)),
+        }[interleave]
+        data = np.memmap(path, dtype=dtype, mode="r", offset=int(header.get("header offset", "0")), shape=shape)
+        self._image = data.transpose(axes)  # (каналы, строки, столбцы)
+
+    def read(self, window) -> np.ndarray:
+        rows = slice(int(window.row_off), int(window.row_off + window.height))
+        cols = slice(int(window.col_off), int(window.col_off + window.width))
+        return self._image[:, rows, cols]
+
+
+def reader(ds):
+    """Объект с ``read(window) -> ndarray | None`` для быстрого пути или None.
+
+    ``read`` возвращает массив ``(каналы, строки, столбцы)`` — представление
+    поверх отображения файла — или None, если это окно нужно читать через
+    ``ds.read``.
+    """
+    path = ds.name
+    if not os.path.isfile(path) or len(set(ds.dtypes)) != 1:
+        return None
+    try:
+        np.dtype(ds.dtypes[0])
+    except TypeError:  # complex_int16 и т.п. не имеют типа numpy
+        return None
+
+    try:
+        if ds.driver == "GTiff":
+            # NBITS GDAL сообщает на уровне каналов, COMPRESSION — датасета.
+            image_structure = [ds.tags(ns="IMAGE_STRUCTURE")]
+            image_structure += [ds.tags(bidx, ns="IMAGE_STRUCTURE") for bidx in ds.indexes]
+            if any(key in tags for tags in image_structure for key in _GTIFF_IMAGE_STRUCTURE_BLOCKERS):
+                return None
+            return _GTiffReader(ds, path)
+        if ds.driver == "ENVI":
+            headers = [name for name in ds.files if name.lower().endswith(".hdr")]
+            if not headers:
+                return None
+            header = _read_envi_header(headers[0])
+            if header.get("file compression", "0") != "0":
+                return None
+            return _EnviReader(ds, path, header)
+    except (OSError, KeyError, ValueError):
+        return None
+    return None
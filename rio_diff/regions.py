@@ -0,0 +1,278 @@
+"""Связные области отличающихся пикселей.
+
+``RegionLabeler`` передаётся в ``calc_diff`` и получает маску отличий и
+модуль разности каждого окна. Окно размечается ``scipy.ndimage.label``
+(4-связность, как у ``gdal_polygonize``), от разметки остаются только
+агрегаты по меткам. Области, не касающиеся общих с другими окнами краёв,
+готовы сразу; метки на краях ждут соседнее окно и склеиваются с его
+метками системой непересекающихся множеств. Область считается готовой,
+как только ни одна её метка не лежит на крае, чей сосед ещё не обработан.
+Готовые области попадают в буфер ``max_regions`` крупнейших, поэтому память
+ограничена незакрытыми краями окон и этим буфером, а не числом областей.
+
+Для каждой области считаются число пикселей, максимум и среднее модуля
+разности, охват и центроид; в координаты растра их переводит ``result``.
+Экспорт — GeoJSON (без зависимостей) или GeoPackage через fiona; геометрия
+области — её охват.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from rio_diff import models
+
+# Столбцы агрегатов области: число пикселей, сумма и максимум модуля
+# разности, суммы координат центров пикселей, охват (конец не включается).
+_COUNT, _SUM_DIFF, _MAX_DIFF, _SUM_ROW, _SUM_COL, _ROW_MIN, _COL_MIN, _ROW_MAX, _COL_MAX = range(9)
+_FIELDS = 9
+# Сколько готовых областей копить перед отбором крупнейших.
+_PRUNE_BATCH = 4096
+
+
+class RegionLabeler:
+    def __init__(self, max_regions: int | None = None):
+        """``max_regions`` — сколько крупнейших областей хранить (None — все)."""
+        try:
+            from scipy import ndimage
+        except ImportError as error:
+            raise ImportError("Change regions require scipy (pip install rio-diff[regions])") from error
+        self._ndimage = ndimage
+        self._max_regions = max_regions
+        self._next_label = 1
+        self._total = 0
+        # Готовые области: крупнейшие сверху, не больше max_regions после _prune.
+        self._kept = np.empty((0, _FIELDS))
+        self._finished: list[np.ndarray | list[float]] = []
+        self._finished_count = 0
+        # Незакрытые области, по корню множества: агрегаты, метки и число
+        # пикселей на ещё не сопоставленных краях.
+        self._parent: dict[int, int] = {}
+        self._open: dict[int, list[float]] = {}
+        self._members: dict[int, list[int]] = {}
+        self._refs: dict[int, int] = {}
+        # Края окон, ждущие соседа: (ориентация, строка, столбец, длина) ->
+        # метки или None, если на крае нет отличий.
+        self._edges: dict[tuple, np.ndarray | None] = {}
+
+    def _find(self, label: int) -> int:
+        parent = self._parent
+        root = label
+        while parent[root] != root:
+            root = parent[root]
+        while parent[label] != root:
+            parent[label], label = root, parent[label]
+        return root
+
+    def _union(self, left: int, right: int) -> None:
+        left, right = self._find(left), self._find(right)
+        if left == right:
+            return
+        if len(self._members[left]) < len(self._members[right]):
+            left, right = right, left
+        self._parent[right] = left
+        self._members[left] += self._members.pop(right)
+        self._refs[left] += self._refs.pop(right)
+        target, source = self._open[left], self._open.pop(right)
+        for column in (_COUNT, _SUM_DIFF, _SUM_ROW, _SUM_COL):
+            target[column] += source[column]
+        for column in (_MAX_DIFF, _ROW_MAX, _COL_MAX):
+            target[column] = max(target[column], source[column])
+        for column in (_ROW_MIN, _COL_MIN):
+            target[column] = min(target[column], source[column])
+
+    def _count_refs(self, edge: np.ndarray, sign: int) -> None:
+        labels, counts = np.unique(edge[edge > 0], return_counts=True)
+        for label, count in zip(labels.tolist(), counts.tolist()):
+            self._refs[self._find(label)] += sign * count
+
+    def _finish(self, root: int) -> None:
+        for member in self._members.pop(root):
+            del self._parent[member]
+        del self._refs[root]
+        self._finished.append(self._open.pop(root))
+        self._finished_count += 1
+        self._total += 1
+
+    def _prune(self) -> None:
+        """Слить готовые области в буфер и оставить в нём ``max_regions`` крупнейших."""
+        if not self._finished:
+            return
+        parts = [self._kept] + [np.atleast_2d(np.asarray(part, dtype=np.float64)) for part in self._finished]
+        kept = np.concatenate(parts)
+        self._finished = []
+        self._finished_count = 0
+        # Крупнейшие по площади, при равенстве — по максимальной разности,
+        # затем по положению (для воспроизводимости).
+        order = np.lexsort((kept[:, _COL_MIN], kept[:, _ROW_MIN], -kept[:, _MAX_DIFF], -kept[:, _COUNT]))
+        self._kept = kept[order[:self._max_regions]]
+
+    def update(self, window, changed: np.ndarray, magnitude: np.ndarray) -> None:
+        """Учесть окно.
+
+        ``changed`` — маска отличий (строки, столбцы), ``magnitude`` — модуль
+        разности в тех же пикселях.
+        """
+        local, count = self._ndimage.label(changed)
+        row_off, col_off = int(window.row_off), int(window.col_off)
+        height, width = local.shape
+        first = self._next_label
+        self._next_label += count
+
+        aggregates = np.empty((count, _FIELDS))
+        if count:
+            rows, cols = np.nonzero(local)
+            flat = local[rows, cols] - 1
+            aggregates[:, _COUNT] = np.bincount(flat, minlength=count)
+            aggregates[:, _SUM_DIFF] = np.bincount(flat, weights=magnitude[rows, cols], minlength=count)
+            aggregates[:, _SUM_ROW] = np.bincount(flat, weights=rows, minlength=count)
+            aggregates[:, _SUM_ROW] += aggregates[:, _COUNT] * (row_off + 0.5)
+            aggregates[:, _SUM_COL] = np.bincount(flat, weights=cols, minlength=count)
+            aggregates[:, _SUM_COL] += aggregates[:, _COUNT] * (col_off + 0.5)
+            aggregates[:, [_MAX_DIFF, _ROW_MAX, _COL_MAX]] = -np.inf
+            aggregates[:, [_ROW_MIN, _COL_MIN]] = np.inf
+            np.maximum.at(aggregates[:, _MAX_DIFF], flat, magnitude[rows, cols])
+            np.minimum.at(aggregates[:, _ROW_MIN], flat, rows)
+            np.minimum.at(aggregates[:, _COL_MIN], flat, cols)
+            np.maximum.at(aggregates[:, _ROW_MAX], flat, rows)
+            np.maximum.at(aggregates[:, _COL_MAX], flat, cols)
+            aggregates[:, [_ROW_MIN, _ROW_MAX]] += (row_off, row_off + 1)
+            aggregates[:, [_COL_MIN, _COL_MAX]] += (col_off, col_off + 1)
+
+        # Края окна; верхний и левый край растра ни с чем не граничат.
+        sides = [
+            (("h", row_off + height, col_off, width), local[-1]),
+            (("v", row_off, col_off + width, height), local[:, -1]),
+        ]
+        if row_off:
+            sides.append((("h", row_off, col_off, width), local[0]))
+        if col_off:
+            sides.append((("v", row_off, col_off, height), local[:, 0]))
+
+        on_edge = np.zeros(count + 1, dtype=bool)
+        for _, edge in sides:
+            on_edge[edge] = True
+        on_edge = on_edge[1:]
+        # Области внутри окна готовы сразу.
+        inner = int(count - on_edge.sum())
+        if inner:
+            self._finished.append(aggregates[~on_edge])
+            self._finished_count += inner
+            self._total += inner
+        for index in np.flatnonzero(on_edge).tolist():
+            label = first + index
+            self._parent[label] = label
+            self._open[label] = aggregates[index].tolist()
+            self._members[label] = [label]
+            self._refs[label] = 0
+
+        candidates = [first + index for index in np.flatnonzero(on_edge).tolist()]
+        for key, edge in sides:
+            edge = np.where(edge > 0, edge + (first - 1), 0) if edge.any() else None
+            if key not in self._edges:
+                self._edges[key] = edge
+                if edge is not None:
+                    self._count_refs(edge, 1)
+                continue
+            neighbour = self._edges.pop(key)
+            if edge is None or neighbour is None:
+                if neighbour is not None:
+                    self._count_refs(neighbour, -1)
+                    candidates += np.unique(neighbour[neighbour > 0]).tolist()
+                continue
+            self._count_refs(neighbour, -1)
+            candidates += np.unique(neighbour[neighbour > 0]).tolist()
+            touching = (edge > 0) & (neighbour > 0)
+            pairs = np.unique(np.stack([edge[touching], neighbour[touching]], axis=1), axis=0)
+            for left, right in pairs.tolist():
+                self._union(left, right)
+
+        for label in candidates:
+            if label in self._parent:
+                root = self._find(label)
+                if not self._refs[root]:
+                    self._finish(root)
+        # Буфер сжимается пачками: без предела хранить приходится всё.
+        if self._max_regions is not None and self._finished_count >= max(self._max_regions, _PRUNE_BATCH):
+            self._prune()
+
+    def result(self, transform) -> models.ChangeRegions:
+        """Закрыть оставшиеся области и вернуть крупнейшие."""
+        for root in [label for label in self._open]:
+            self._finish(root)
+        self._parent.clear()
+        self._edges.clear()
+        self._prune()
+
+        regions = []
+        for row in self._kept:
+            count = row[_COUNT]
+            xs, ys = zip(*(
+                transform * (float(col), float(row_index))
+                for col, row_index in ((row[_COL_MIN], row[_ROW_MIN]), (row[_COL_MAX], row[_ROW_MIN]),
+                                       (row[_COL_MIN], row[_ROW_MAX]), (row[_COL_MAX], row[_ROW_MAX]))
+            ))
+            centroid_x, centroid_y = transform * (float(row[_SUM_COL] / count), float(row[_SUM_ROW] / count))
+            regions.append(models.ChangeRegion(
+                count=int(count),
+                bbox=(min(xs), min(ys), max(xs), max(ys)),
+                centroid=(centroid_x, centroid_y),
+                max_diff=float(row[_MAX_DIFF]),
+                mean_diff=float(row[_SUM_DIFF] / count),
+            ))
+        return models.ChangeRegions(total_count=self._total, regions=regions)
+
+
+def _features(regions: list[models.ChangeRegion]):
+    for rank, region in enumerate(regions, start=1):
+        left, bottom, right, top = region.bbox
+        yield {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[(left, bottom), (right, bottom), (right, top), (left, top), (left, bottom)]],
+            },
+            "properties": {
+                "rank": rank,
+                "count": region.count,
+                "max_diff": region.max_diff,
+                "mean_diff": region.mean_diff,
+                "centroid_x": region.centroid[0],
+                "centroid_y": region.centroid[1],
+            },
+        }
+
+
+def write_regions(path: str, regions: list[models.ChangeRegion], crs=None) -> None:
+    """Записать области в GeoJSON или, для ``.gpkg``, в GeoPackage (fiona)."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if Path(path).suffix.lower() == ".gpkg":
+        try:
+            import fiona
+        except ImportError as error:
+            raise ImportError("GeoPackage export requires fiona (pip install rio-diff[regions])") from error
+        schema = {
+            "geometry": "Polygon",
+            "properties": {
+                "rank": "int",
+                "count": "int",
+                "max_diff": "float",
+                "mean_diff": "float",
+                "centroid_x": "float",
+                "centroid_y": "float",
+            },
+        }
+        crs_wkt = crs.to_wkt() if crs is not None else None
+        with fiona.open(path, "w", driver="GPKG", schema=schema, crs_wkt=crs_wkt) as layer:
+            layer.writerecords(_features(regions))
+        return
+
+    document = {"type": "FeatureCollection", "features": list(_features(regions))}
+    if crs is not None:
+        # RFC 7946 допускает только WGS 84; для других систем координат
+        # оставляем устаревший, но понятный GDAL/QGIS член "crs".
+        document["crs"] = {"type": "name", "properties": {"name": crs.to_string()}}
+    with open(path, "w") as file:
+        json.dump(document, file)
+        file.write("\n")
@@ -1,13 +1,15 @@
 """Вывод отчёта сравнения растров в консоль в стиле pytest-diff.
 
-Показываются только различия. Каждое поле выводится единым способом — как
-pytest показывает `assert base == test`: unified-diff по ``pprint``-представлению,
-где строки ``-`` относятся к base (красный), ``+`` — к test (зелёный), а
-неизменившиеся строки служат контекстом.
+Показываются только различия. Каждое поле выводится единым способом:
+значения обходятся структурно (dict — по ключам, list/tuple — по индексам),
+и для каждого изменившегося листа печатается его путь и пара строк, где
+``-`` относится к base (красный), а ``+`` — к test (зелёный). Путь служит
+контекстом вместо неизменившихся соседних строк.
 """
 
-import difflib
+import math
 import pprint
+import reprlib
 
 import click
 from affine import Affine
@@ -23,7 +25,22 @@ _TRANSFORM_ATTRS = (
     ("e", "pixel height"),
     ("f", "upper-left y"),
 )
-_CONTEXT_LINES = 2
+# Сколько изменившихся путей печатать на одно поле; об остальных выводится
+# только их число. Без ограничения отчёт по 10k GCP или большим XML-метаданным
+# становится нечитаемым и долго печатается.
+_MAX_DIFF_PATHS = 50
+# Сколько областей отличий печатать в текстовом отчёте (все — в --regions).
+_MAX_REGIONS_SHOWN = 10
+
+# Значения печатаются в сокращённом виде, чтобы добавленный словарь
+# метаданных или длинная строка XML не занимали весь экран.
+_short = reprlib.Repr()
+_short.maxstring = 80
+_short.maxother = 80
+_short.maxlist = _short.maxtuple = _short.maxdict = 8
+_short.maxlevel = 2
+
+_MISSING = object()
 
 
 def _has_attrs(value, attrs) -> bool:
@@ -31,13 +48,12 @@ def _has_attrs(value, attrs) -> bool:
 
 
 def _prepare(value):
-    """Разложить объекты по полям, чтобы ``pprint`` печатал их построчно.
+    """Разложить объекты по полям, чтобы diff спускался до отдельных полей.
 
     Statistics/BBox/Transform и подобные объекты в repr-е выглядят одной
-    строкой, поэтому diff краснит их целиком. Превращаем их в dict по полям
-    (рекурсивно), тогда каждое поле оказывается на своей строке и в diff-е
-    подсвечивается только изменившееся. Ключи внешних dict сортируем, чтобы
-    base и test были выровнены.
+    строкой, поэтому diff показывал бы их целиком. Превращаем их в dict по
+    полям (рекурсивно), тогда в diff-е виден только изменившийся атрибут.
+    Ключи dict сортируем, чтобы порядок вывода был стабильным.
     """
     if isinstance(value, dict):
         return {key: _prepare(value[key]) for key in sorted(value, key=str)}
@@ -68,35 +84,74 @@ def _lines(value) -> list[str]:
     return text.splitlines() or [text]
 
 
-def _print_value_diff(base, test, indent: str = "  ") -> None:
-    lines = [
-        line
-        for line in difflib.ndiff(_lines(base), _lines(test))
-        if line[:2] != "? "  # подсказки ndiff с ^~+ — пропускаем как шум
-    ]
+def _same(base, test) -> bool:
+    if isinstance(base, float) and isinstance(test, float) and math.isnan(base) and math.isnan(test):
+        return True
+    return base == test
+
+
+def _path(parent: str, key) -> str:
+    if isinstance(key, int):
+        return f"{parent}[{key}]"
+    if isinstance(key, str) and key.isidentifier():
+        return f"{parent}.{key}" if parent else key
+    return f"{parent}[{key!r}]"
+
+
+def _walk(base, test, path: str = ""):
+    """Обойти пару значений и выдать изменившиеся листья как ``(путь, base, test)``.
+
+    Отсутствующая сторона обозначается ``_MISSING``. У списков сначала
+    отбрасываются общие начало и конец, а середина сопоставляется по индексам,
+    так что обход линеен по размеру значений (в отличие от ``difflib``).
+    """
+    if _same(base, test):
+        return
+    if isinstance(base, dict) and isinstance(test, dict):
+        for key in sorted(base.keys() | test.keys(), key=str):
+            yield from _walk(base.get(key, _MISSING), test.get(key, _MISSING), _path(path, key))
+        return
+    if isinstance(base, list) and isinstance(test, list):
+        start = 0
+        common = min(len(base), len(test))
+        while start < common and _same(base[start], test[start]):
+            start += 1
+        base_end, test_end = len(base), len(test)
+        while base_end > start and test_end > start and _same(base[base_end - 1], test[test_end - 1]):
+            base_end -= 1
+            test_end -= 1
+        for offset in range(max(base_end, test_end) - start):
+            idx = start + offset
+            yield from _walk(
+                base[idx] if idx < base_end else _MISSING,
+                test[idx] if idx < test_end else _MISSING,
+                _path(path, idx),
+            )
+        return
+    yield path, base, test
+
+
+def _format(value, nested: bool) -> str:
+    # Скаляры верхнего уровня печатаем через ``str`` — так у объектов с коротким
+    # представлением (например, CRS → ``EPSG:32637``) не всплывает громоздкий repr.
+    if not nested and not isinstance(value, (dict, list)):
+        return str(value)
+    return _short.repr(value)
 
-    keep = [False] * len(lines)
-    for i, line in enumerate(lines):
-        if line[:2] in ("- ", "+ "):
-            lo = max(0, i - _CONTEXT_LINES)
-            hi = min(len(lines), i + _CONTEXT_LINES + 1)
-            keep[lo:hi] = [True] * (hi - lo)
-
-    skipping = False
-    for line, kept in zip(lines, keep):
-        if not kept:
-            if not skipping:
-                click.secho(f"{indent}...", dim=True)
-                skipping = True
+
+def _print_value_diff(base, test, indent: str = "  ") -> None:
+    hidden = 0
+    for shown, (path, base_leaf, test_leaf) in enumerate(_walk(_prepare(base), _prepare(test))):
+        if shown >= _MAX_DIFF_PATHS:
+            hidden += 1
             continue
-        skipping = False
-        tag = line[:2]
-        if tag == "- ":
-            click.secho(f"{indent}{line}", fg="red")
-        elif tag == "+ ":
-            click.secho(f"{indent}{line}", fg="green")
-        else:  # "  " — общий контекст
-            click.echo(f"{indent}{line}")
+        label = f"{path}: " if path else ""
+        if base_leaf is not _MISSING:
+            click.secho(f"{indent}- {label}{_format(base_leaf, bool(path))}", fg="red")
+        if test_leaf is not _MISSING:
+            click.secho(f"{indent}+ {label}{_format(test_leaf, bool(path))}", fg="green")
+    if hidden:
+        click.secho(f"{indent}... and {hidden} more differences", dim=True)
 
 
 def _print_mismatch(label: str, base, test) -> None:
@@ -115,18 +170,51 @@ def _print_mismatch_bands(label: str, base, test) -> None:
             _print_value_diff(base_band, test_band, indent="  ")
 
 
+def _print_pixel_diffs(diffs: list[tuple[int, models.PixelDiffStats]]) -> None:
+    for bidx, stat in diffs:
+        click.secho(f"Band {bidx}", bold=False)
+        row = {
+            "diff_count": stat.diff_count,
+            "diff_percent": round(stat.diff_percent, 2),
+            "max_diff": stat.max_diff,
+            "rmse": stat.rmse,
+            "mask_diff_count": stat.mask_diff_count,
+        }
+        for line in _lines(row):
+            click.secho(f"  {line}", fg="red")
+
+
+def _changed_bands(pixel_values: list[models.PixelDiffStats]) -> list[tuple[int, models.PixelDiffStats]]:
+    return [
+        (bidx, stat)
+        for bidx, stat in enumerate(pixel_values, start=1)
+        if stat.diff_count > 0 or stat.mask_diff_count > 0
+    ]
+
+
 def print_report(
     checks: list[tuple[str, bool, object, object, bool]],
     pixel_values: list[models.PixelDiffStats] | None,
     show_pixel_values: bool,
+    title: str | None = None,
+    overview_values: list[models.OverviewPixelDiff] | None = None,
+    regions: models.ChangeRegions | None = None,
 ) -> bool:
-    """Вывести различия. Возвращает True, если найдено хотя бы одно."""
+    """Вывести различия. Возвращает True, если найдено хотя бы одно.
+
+    ``title`` (например, имя подсета) печатается перед первым различием,
+    ``overview_values`` — результаты попиксельного сравнения уровней обзоров,
+    ``regions`` — связные области отличий (выводятся первые
+    ``_MAX_REGIONS_SHOWN``).
+    """
     printed = 0
 
     def separate() -> None:
         nonlocal printed
         if printed:
             click.echo()
+        elif title is not None:
+            click.secho(f"== {title} ==", bold=True, fg="cyan")
         printed += 1
 
     for label, equal, base, test, per_band in checks:
@@ -145,24 +233,36 @@ def print_report(
                 fg="yellow",
             )
         else:
-            diffs = [
-                (bidx, stat)
-                for bidx, stat in enumerate(pixel_values, start=1)
-                if stat.diff_count > 0 or stat.mask_diff_count > 0
-            ]
+            diffs = _changed_bands(pixel_values)
             if diffs:
                 separate()
                 click.secho("Pixel values", bold=True)
-                for bidx, stat in diffs:
-                    click.secho(f"Band {bidx}", bold=False)
-                    row = {
-                        "diff_count": stat.diff_count,
-                        "diff_percent": round(stat.diff_percent, 2),
-                        "max_diff": stat.max_diff,
-                        "rmse": stat.rmse,
-                        "mask_diff_count": stat.mask_diff_count,
-                    }
-                    for line in _lines(row):
-                        click.secho(f"  {line}", fg="red")
+                _print_pixel_diffs(diffs)
+
+    for overview in overview_values or []:
+        label = f"Overview level {overview.level} (1/{overview.factor})"
+        if overview.pixel_values is None:
+            separate()
+            click.secho(f"{label}: pixel values not compared (incompatible shape)", fg="yellow")
+            continue
+        diffs = _changed_bands(overview.pixel_values)
+        if diffs:
+            separate()
+            click.secho(label, bold=True)
+            _print_pixel_diffs(diffs)
+
+    if regions is not None and regions.total_count:
+        separate()
+        click.secho(f"Change regions: {regions.total_count}", bold=True)
+        shown = regions.regions[:_MAX_REGIONS_SHOWN]
+        for rank, region in enumerate(shown, start=1):
+            bbox = ", ".join(f"{value:g}" for value in region.bbox)
+            click.secho(
+                f"  #{rank}: {region.count} px, max_diff {region.max_diff:g}, "
+                f"mean_diff {region.mean_diff:g}, bbox ({bbox})",
+                fg="red",
+            )
+        if regions.total_count > len(shown):
+            click.echo(f"  ... and {regions.total_count - len(shown)} more regions")
 
     return printed > 0
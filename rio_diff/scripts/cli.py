@@ -1,9 +1,13 @@
+import contextlib
 import sys
 
 import click
 
-from rio_diff import __version__ as plugin_version, render
-from rio_diff.compare import compare_rasters
+from rio_diff import __version__ as plugin_version
+
+# Плагин импортируется при каждом запуске ``rio`` (даже ``rio info``), поэтому
+# здесь нет ничего тяжелее click: сравнение, вывод отчёта и профилирование
+# импортируются внутри команды, только когда ``diff`` действительно запущен.
 
 _PROGRESS_STEPS = 1000
 
@@ -32,6 +36,98 @@ class _ProgressBar:
             self._label = None
 
 
+# (поле RasterDiff, подпись, по каналам, группа флагов --ignore-*)
+_CHECKS = (
+    ("checksum", "Checksum", False, "checksum"),
+    ("bands", "Bands", False, "bands"),
+    ("width", "Width", False, "shape"),
+    ("height", "Height", False, "shape"),
+    ("dtype", "Data type", False, "dtype"),
+    ("nodata", "NoData", False, "nodata"),
+    ("crs", "CRS", False, "crs"),
+    ("transform", "Transform", False, "transform"),
+    ("bbox", "BBox", False, "bbox"),
+    ("gcps", "GCPs", False, "gcps"),
+    ("rpcs", "RPCs", False, "gcps"),
+    ("scales", "Scales", False, "scales"),
+    ("offsets", "Offsets", False, "scales"),
+    ("units", "Units", False, "scales"),
+    ("colorinterp", "Color interpretation", False, "colorinterp"),
+    ("colormap", "Colormap", True, "colormap"),
+    ("mask_flags", "Mask flags", True, "image_structure"),
+    ("overviews", "Overviews", True, "image_structure"),
+    ("image_structure", "Image structure", False, "image_structure"),
+    ("descriptions", "Band descriptions", False, "metadata"),
+    ("metadata", "Metadata", False, "metadata"),
+    ("bands_metadata", "Bands metadata", True, "metadata"),
+    ("stats", "Statistics", True, "stats"),
+)
+
+
+def _collect_checks(report, ignored: set[str]) -> list[tuple[str, tuple[str, bool, object, object, bool]]]:
+    checks = []
+    for field, label, per_band, group in _CHECKS:
+        if group not in ignored:
+            diff = getattr(report, field)
+            checks.append((field, (label, diff.equal, diff.base, diff.test, per_band)))
+    return checks
+
+
+def _subdataset_section(subreport, ignored: set[str]) -> tuple[list, list | None]:
+    # У подсетов нет своего файла, контрольная сумма для них не считается.
+    return _collect_checks(subreport, ignored | {"checksum"}), subreport.pixel_values
+
+
+_TOLERANCE_KEYS = {"atol": float, "rtol": float, "max_ulps": int}
+
+
+def _parse_band_tolerances(ctx, param, values) -> dict[int, dict]:
+    """``BIDX:key=value,...`` -> {номер канала: {ключ: значение}}.
+
+    Значения проверяются так же, как у ``--atol``/``--rtol``/``--max-ulps``:
+    не меньше нуля. Номер канала сверяется с растром уже при сравнении.
+    """
+    overrides = {}
+    for value in values:
+        bidx, sep, spec = value.partition(":")
+        try:
+            if not sep or int(bidx) < 1:
+                raise ValueError
+            fields = {}
+            for item in spec.split(","):
+                key, _, number = item.partition("=")
+                fields[key.strip()] = _TOLERANCE_KEYS[key.strip()](number)
+        except (KeyError, ValueError):
+            raise click.BadParameter(
+                f"{value!r}: expected BIDX:atol=..,rtol=..,max_ulps=.. (band numbers start at 1)",
+                ctx=ctx,
+                param=param,
+            )
+        negative = [key for key, number in fields.items() if not number >= 0]
+        if negative:
+            raise click.BadParameter(f"{value!r}: {negative[0]} must be >= 0", ctx=ctx, param=param)
+        overrides.setdefault(int(bidx), {}).update(fields)
+    return overrides
+
+
+def _write_regions(path: str, regions: list, crs) -> None:
+    from rio_diff.regions import write_regions
+
+    try:
+        write_regions(path, regions, crs)
+    except ImportError as error:  # GeoPackage без fiona
+        raise click.ClickException(str(error))
+
+
+def _emit_profile(profiler, to_stderr: bool, path: str | None) -> None:
+    if profiler is None:
+        return
+    if to_stderr:
+        click.echo(profiler.format_table(), err=True)
+    if path is not None:
+        profiler.write_json(path)
+
+
 @click.command("diff", short_help="Compare rasters")
 @click.argument("base_raster", type=click.Path(exists=True))
 @click.argument("test_raster", type=click.Path(exists=True))
@@ -133,6 +229,14 @@ class _ProgressBar:
     help="Statistics will be ignored.",
     show_default=True,
 )
+@click.option(
+    "--approx-stats",
+    default=False,
+    is_flag=True,
+    help="Accept approximate statistics from GDAL (STATISTICS_* tags or overviews) "
+         "when pixel values are not compared.",
+    show_default=True,
+)
 @click.option(
     "--ignore-pixels",
     "ignore_pixel_values",
@@ -141,6 +245,35 @@ class _ProgressBar:
     help="Pixel values will be ignored.",
     show_default=True,
 )
+@click.option(
+    "--atol",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    help="Absolute tolerance: pixels are equal when |base - test| <= atol + rtol * |test|.",
+    show_default=True,
+)
+@click.option(
+    "--rtol",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    help="Relative tolerance (see --atol).",
+    show_default=True,
+)
+@click.option(
+    "--max-ulps",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Also treat floating-point pixels as equal when they are at most this many representable "
+         "values apart (for integer bands: value steps).",
+)
+@click.option(
+    "--band-tolerance",
+    "band_tolerances",
+    multiple=True,
+    callback=_parse_band_tolerances,
+    metavar="BIDX:atol=..,rtol=..,max_ulps=..",
+    help="Override the tolerance of one band; unspecified keys keep the global values. Repeatable.",
+)
 @click.option(
     "--checksum",
     "check_checksum",
@@ -156,6 +289,75 @@ class _ProgressBar:
     default=None,
     help="Save the per-pixel difference raster (base - test) to the given path.",
 )
+@click.option(
+    "--regions",
+    "regions_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Find connected regions of differing pixels and write the largest ones to the given "
+         "GeoJSON (or .gpkg, requires fiona) file. Requires scipy (pip install rio-diff[regions]).",
+)
+@click.option(
+    "--max-regions",
+    type=click.IntRange(min=1),
+    default=100,
+    help="How many of the largest change regions to keep.",
+    show_default=True,
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["local", "dask"]),
+    default="local",
+    help="How the pixel comparison runs: a window loop in this process, or a dask task graph "
+         "on a local process pool (requires dask; falls back to local without it or with --save-diff).",
+    show_default=True,
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes for the dask backend and --subdatasets (default: CPU count).",
+)
+@click.option(
+    "--subdatasets",
+    "with_subdatasets",
+    default=False,
+    is_flag=True,
+    help="Also compare subdatasets of container formats (NetCDF, HDF, GPKG...) pairwise, "
+         "in parallel worker processes.",
+    show_default=True,
+)
+@click.option(
+    "--overviews",
+    "compare_overviews",
+    default=False,
+    is_flag=True,
+    help="Also compare pixel values of every matching overview level.",
+    show_default=True,
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json", "ndjson"]),
+    default="text",
+    help="Report format: colored text, one JSON document, or a stream of NDJSON events "
+         "(progress, checks, per-band pixel results, summary).",
+    show_default=True,
+)
+@click.option(
+    "--profile",
+    "profile_stderr",
+    default=False,
+    is_flag=True,
+    help="Print per-phase timings, I/O and memory usage to stderr.",
+    show_default=True,
+)
+@click.option(
+    "--profile-file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write per-phase timings, I/O and memory usage as JSON to the given path.",
+)
 @click.version_option(version=plugin_version, message="%(version)s")
 @click.pass_context
 def diff(
@@ -176,57 +378,153 @@ def diff(
     ignore_image_structure,
     ignore_metadata,
     ignore_stats,
+    approx_stats,
     ignore_pixel_values,
+    atol,
+    rtol,
+    max_ulps,
+    band_tolerances,
     check_checksum,
     save_diff,
+    regions_path,
+    max_regions,
+    backend,
+    workers,
+    with_subdatasets,
+    compare_overviews,
+    output_format,
+    profile_stderr,
+    profile_file,
 ):
     """Rasterio diff plugin.
     """
-    report = compare_rasters(
-        base_raster,
-        test_raster,
-        diff_raster_path=save_diff,
-        ignore_pixel_values=ignore_pixel_values,
-        ignore_stats=ignore_stats,
-        progress=_ProgressBar() if sys.stderr.isatty() else None,
-    )
+    import dataclasses
+
+    from rio_diff import models, profiling, render, serialize
+    from rio_diff.compare import UnknownBandError, compare_rasters
+
+    tolerance = models.Tolerance(atol=atol, rtol=rtol, max_ulps=max_ulps)
+    band_tolerances = {
+        bidx: dataclasses.replace(tolerance, **fields) for bidx, fields in band_tolerances.items()
+    }
+
+    ignore = {
+        "checksum": not check_checksum,
+        "bands": ignore_bands,
+        "shape": ignore_shape,
+        "dtype": ignore_dtype,
+        "nodata": ignore_nodata,
+        "crs": ignore_crs,
+        "transform": ignore_transform,
+        "bbox": ignore_bbox,
+        "gcps": ignore_gcps,
+        "scales": ignore_scales,
+        "colorinterp": ignore_colorinterp,
+        "colormap": ignore_colormap,
+        "image_structure": ignore_image_structure,
+        "metadata": ignore_metadata,
+        "stats": ignore_stats,
+    }
+    ignored = {group for group, flag in ignore.items() if flag}
+    show_pixel_values = not ignore_pixel_values
+
+    profiler = profiling.Profiler() if profile_stderr or profile_file else None
+    ndjson = serialize.NdjsonWriter() if output_format == "ndjson" else None
+    on_pixel_values = on_subdataset = None
+    if ndjson is not None:
+        progress = ndjson.progress
+        # Длинные прогоны: результаты выписываются, как только посчитаны.
+        if show_pixel_values:
+            on_pixel_values = ndjson.pixel_values
+
+        def on_subdataset(key, subreport):
+            ndjson.subdataset(key, _subdataset_section(subreport, ignored), show_pixel_values)
+    else:
+        progress = _ProgressBar() if sys.stderr.isatty() else None
+
+    try:
+        report = compare_rasters(
+            base_raster,
+            test_raster,
+            diff_raster_path=save_diff,
+            ignore_pixel_values=ignore_pixel_values,
+            ignore_stats=ignore_stats,
+            approx_stats=approx_stats,
+            backend=backend,
+            workers=workers,
+            with_subdatasets=with_subdatasets,
+            compare_overviews=compare_overviews,
+            atol=atol,
+            rtol=rtol,
+            max_ulps=max_ulps,
+            band_tolerances=band_tolerances,
+            collect_regions=regions_path is not None,
+            max_regions=max_regions,
+            progress=progress,
+            profiler=profiler,
+            on_pixel_values=on_pixel_values,
+            on_subdataset=on_subdataset,
+        )
+    except ImportError as error:  # необязательные зависимости --regions
+        raise click.ClickException(str(error))
+    except UnknownBandError as error:  # --band-tolerance для несуществующего канала
+        raise click.BadParameter(str(error), ctx=ctx, param_hint="'--band-tolerance'")
 
     if report is None:
+        if regions_path is not None:
+            # Побайтно одинаковые файлы: областей нет, но файл должен появиться.
+            import rasterio
+
+            with rasterio.open(base_raster) as ds:
+                _write_regions(regions_path, [], ds.crs)
+        if ndjson is not None:
+            ndjson.report(None, None, show_pixel_values=False)
+        elif output_format == "json":
+            serialize.dump_report(None, None, show_pixel_values=False)
+        _emit_profile(profiler, profile_stderr, profile_file)
         ctx.exit(0)
 
-    checks: list[tuple[str, bool, object, object, bool]] = []
-
-    def add(ignore: bool, diff, label: str, per_band: bool = False) -> None:
-        if not ignore:
-            checks.append((label, diff.equal, diff.base, diff.test, per_band))
-
-    add(not check_checksum, report.checksum, "Checksum")
-    add(ignore_bands, report.bands, "Bands")
-    add(ignore_shape, report.width, "Width")
-    add(ignore_shape, report.height, "Height")
-    add(ignore_dtype, report.dtype, "Data type")
-    add(ignore_nodata, report.nodata, "NoData")
-    add(ignore_crs, report.crs, "CRS")
-    add(ignore_transform, report.transform, "Transform")
-    add(ignore_bbox, report.bbox, "BBox")
-    add(ignore_gcps, report.gcps, "GCPs")
-    add(ignore_gcps, report.rpcs, "RPCs")
-    add(ignore_scales, report.scales, "Scales")
-    add(ignore_scales, report.offsets, "Offsets")
-    add(ignore_scales, report.units, "Units")
-    add(ignore_colorinterp, report.colorinterp, "Color interpretation")
-    add(ignore_colormap, report.colormap, "Colormap", per_band=True)
-    add(ignore_image_structure, report.mask_flags, "Mask flags", per_band=True)
-    add(ignore_image_structure, report.overviews, "Overviews", per_band=True)
-    add(ignore_image_structure, report.image_structure, "Image structure")
-    add(ignore_metadata, report.descriptions, "Band descriptions")
-    add(ignore_metadata, report.metadata, "Metadata")
-    add(ignore_metadata, report.bands_metadata, "Bands metadata", per_band=True)
-    add(ignore_stats, report.stats, "Statistics", per_band=True)
-
-    has_diff = render.print_report(
-        checks,
-        report.pixel_values,
-        show_pixel_values=not ignore_pixel_values,
-    )
+    checks = _collect_checks(report, ignored)
+    subdatasets = {
+        key: _subdataset_section(subreport, ignored)
+        for key, subreport in (report.subdatasets.reports.items() if report.subdatasets else ())
+    }
+
+    if regions_path is not None:
+        if report.regions is None:
+            click.secho(
+                "Change regions not computed (pixel values not compared); writing an empty file",
+                fg="yellow", err=True,
+            )
+        _write_regions(regions_path, report.regions.regions if report.regions else [], report.crs.base)
+
+    with (profiler.phase("report") if profiler is not None else contextlib.nullcontext()):
+        if ndjson is not None:
+            has_diff = ndjson.report(
+                checks, report.pixel_values, show_pixel_values, subdatasets, report.overview_values, report.regions,
+            )
+        elif output_format == "json":
+            has_diff = serialize.dump_report(
+                checks, report.pixel_values, show_pixel_values, subdatasets, report.overview_values, report.regions,
+            )
+        else:
+            has_diff = render.print_report(
+                [check for _, check in checks],
+                report.pixel_values,
+                show_pixel_values=show_pixel_values,
+                overview_values=report.overview_values,
+                regions=report.regions,
+            )
+            for key, (sub_checks, sub_pixel_values) in subdatasets.items():
+                if serialize.is_equal(sub_checks, sub_pixel_values, show_pixel_values):
+                    continue
+                if has_diff:
+                    click.echo()
+                has_diff = render.print_report(
+                    [check for _, check in sub_checks],
+                    sub_pixel_values,
+                    show_pixel_values=show_pixel_values,
+                    title=f"Subdataset {key}",
+                ) or has_diff
+    _emit_profile(profiler, profile_stderr, profile_file)
     ctx.exit(1 if has_diff else 0)
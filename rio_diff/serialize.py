@@ -0,0 +1,245 @@
+"""Машиночитаемый вывод отчёта сравнения: JSON целиком или поток NDJSON.
+
+В отличие от ``render`` здесь нет ни цветного вывода, ни построчного diff-а:
+поля отчёта сериализуются как есть, а решение о различиях принимается по
+флагам ``equal``. Неконечные float (NaN в nodata и т.п.) в JSON не
+представимы, поэтому записываются строками ``"nan"``, ``"inf"``, ``"-inf"``.
+"""
+
+import dataclasses
+import json
+import math
+import sys
+from collections.abc import Iterable
+
+from affine import Affine
+from rasterio.crs import CRS
+
+from rio_diff import models
+
+# Один элемент проверки: (поле RasterDiff, (подпись, equal, base, test, поканально)).
+Check = tuple[str, tuple[str, bool, object, object, bool]]
+# Отчёт подсета: проверки и попиксельное сравнение.
+Section = tuple[list[Check], list[models.PixelDiffStats] | None]
+
+_TRANSFORM_ATTRS = ("a", "b", "c", "d", "e", "f")
+
+
+def to_jsonable(value):
+    """Привести значение из отчёта к типам, которые понимает ``json``."""
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {field.name: to_jsonable(getattr(value, field.name)) for field in dataclasses.fields(value)}
+    if isinstance(value, CRS):
+        return value.to_string()
+    if isinstance(value, Affine):
+        return {name: getattr(value, name) for name in _TRANSFORM_ATTRS}
+    if hasattr(value, "_fields"):  # namedtuple, напр. BoundingBox
+        return {name: to_jsonable(getattr(value, name)) for name in value._fields}
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _pixel_changed(stat: models.PixelDiffStats) -> bool:
+    return stat.diff_count > 0 or stat.mask_diff_count > 0
+
+
+def is_equal(
+    checks: Iterable[Check],
+    pixel_values: list[models.PixelDiffStats] | None,
+    show_pixel_values: bool,
+    overview_values: list[models.OverviewPixelDiff] | None = None,
+    regions: models.ChangeRegions | None = None,
+) -> bool:
+    """Нет различий — в том же смысле, что и у ``render.print_report``.
+
+    Несравненные попиксельно растры (``pixel_values is None``) считаются
+    различием, как и в текстовом отчёте; то же для уровней обзоров и
+    найденных областей отличий.
+    """
+    if not all(check[1] for _, check in checks):
+        return False
+    if regions is not None and regions.total_count:
+        return False
+    for overview in overview_values or []:
+        if overview.pixel_values is None or any(_pixel_changed(stat) for stat in overview.pixel_values):
+            return False
+    if not show_pixel_values:
+        return True
+    return pixel_values is not None and not any(_pixel_changed(stat) for stat in pixel_values)
+
+
+def _check_dict(field: str, check: tuple) -> dict:
+    label, equal, base, test, per_band = check
+    return {
+        "field": field,
+        "label": label,
+        "equal": equal,
+        "per_band": per_band,
+        "base": to_jsonable(base),
+        "test": to_jsonable(test),
+    }
+
+
+def _section(
+    checks: list[Check],
+    pixel_values: list[models.PixelDiffStats] | None,
+    show_pixel_values: bool,
+    overview_values: list[models.OverviewPixelDiff] | None = None,
+    regions: models.ChangeRegions | None = None,
+) -> dict:
+    section = {
+        "equal": is_equal(checks, pixel_values, show_pixel_values, overview_values, regions),
+        "checks": {field: _check_dict(field, check) for field, check in checks},
+        "pixel_values": to_jsonable(pixel_values) if show_pixel_values else None,
+    }
+    if overview_values is not None:
+        section["overview_values"] = to_jsonable(overview_values)
+    if regions is not None:
+        section["regions"] = to_jsonable(regions)
+    return section
+
+
+def dump_report(
+    checks: list[Check] | None,
+    pixel_values: list[models.PixelDiffStats] | None,
+    show_pixel_values: bool,
+    subdatasets: dict[str, Section] | None = None,
+    overview_values: list[models.OverviewPixelDiff] | None = None,
+    regions: models.ChangeRegions | None = None,
+    stream=None,
+) -> bool:
+    """Записать отчёт одним JSON-документом. Возвращает True, если есть различия.
+
+    ``checks=None`` означает побайтно идентичные файлы. ``subdatasets`` —
+    отчёты по подсетам контейнера: ключ подсета -> ``(checks, pixel_values)``.
+    ``overview_values`` — попиксельное сравнение уровней обзоров,
+    ``regions`` — связные области отличий.
+    """
+    stream = stream or sys.stdout
+    if checks is None:
+        document = {"identical": True, "equal": True, "checks": {}, "pixel_values": None}
+    else:
+        document = {
+            "identical": False, **_section(checks, pixel_values, show_pixel_values, overview_values, regions),
+        }
+        if subdatasets is not None:
+            document["subdatasets"] = {
+                key: _section(*section, show_pixel_values) for key, section in subdatasets.items()
+            }
+            document["equal"] = document["equal"] and all(
+                section["equal"] for section in document["subdatasets"].values()
+            )
+    json.dump(document, stream)
+    stream.write("\n")
+    stream.flush()
+    return not document["equal"]
+
+
+class NdjsonWriter:
+    """Поток событий NDJSON: по одному JSON-объекту на строку.
+
+    События пишутся по ходу сравнения: прогресс (не чаще, чем раз в процент
+    на фазу), попиксельные результаты по каналам — сразу после прохода по
+    окнам (``pixel_values``), события подсета — как только он сравнён
+    (``subdataset``). Остальное — проверки, уровни обзоров, области отличий и
+    итоговое ``summary`` — выписывает ``report`` в конце.
+    """
+
+    def __init__(self, stream=None):
+        self._stream = stream or sys.stdout
+        self._phase = None
+        self._percent = -1
+        self._pixel_values_sent = False
+        # Уже выписанные подсеты: ключ -> нет различий.
+        self._subdatasets: dict[str, bool] = {}
+
+    def event(self, kind: str, **fields) -> None:
+        self._stream.write(json.dumps({"event": kind, **to_jsonable(fields)}) + "\n")
+        self._stream.flush()
+
+    def progress(self, complete: float, phase: str) -> None:
+        percent = int(complete * 100)
+        if phase == self._phase and percent == self._percent:
+            return
+        self._phase, self._percent = phase, percent
+        self.event("progress", phase=phase, complete=complete)
+
+    def pixel_values(self, pixel_values: list[models.PixelDiffStats]) -> None:
+        """Выписать попиксельное сравнение основного растра, не дожидаясь ``report``."""
+        self._pixel_values(pixel_values)
+        self._pixel_values_sent = True
+
+    def subdataset(self, key: str, section: Section, show_pixel_values: bool) -> None:
+        """Выписать отчёт подсета, как только он готов."""
+        self._subdatasets[key] = self._section(*section, show_pixel_values, subdataset=key)
+
+    def _section(
+        self,
+        checks: list[Check],
+        pixel_values: list[models.PixelDiffStats] | None,
+        show_pixel_values: bool,
+        overview_values: list[models.OverviewPixelDiff] | None = None,
+        regions: models.ChangeRegions | None = None,
+        *,
+        pixel_values_sent: bool = False,
+        **extra,
+    ) -> bool:
+        for field, check in checks:
+            self.event("check", **extra, **_check_dict(field, check))
+        if show_pixel_values and not pixel_values_sent:
+            self._pixel_values(pixel_values, **extra)
+        for overview in overview_values or []:
+            self._pixel_values(overview.pixel_values, **extra, overview_level=overview.level)
+        if regions is not None:
+            self.event("regions", **extra, total_count=regions.total_count)
+            for rank, region in enumerate(regions.regions, start=1):
+                self.event("region", **extra, rank=rank, **to_jsonable(region))
+        return is_equal(checks, pixel_values, show_pixel_values, overview_values, regions)
+
+    def _pixel_values(self, pixel_values: list[models.PixelDiffStats] | None, **extra) -> None:
+        if pixel_values is None:
+            self.event("pixel_values", **extra, band=None, compared=False)
+        else:
+            for bidx, stat in enumerate(pixel_values, start=1):
+                self.event("pixel_values", **extra, band=bidx, compared=True, **to_jsonable(stat))
+
+    def report(
+        self,
+        checks: list[Check] | None,
+        pixel_values: list[models.PixelDiffStats] | None,
+        show_pixel_values: bool,
+        subdatasets: dict[str, Section] | None = None,
+        overview_values: list[models.OverviewPixelDiff] | None = None,
+        regions: models.ChangeRegions | None = None,
+    ) -> bool:
+        """Выписать оставшиеся результаты сравнения. Возвращает True, если есть различия.
+
+        События по подсетам несут поле ``subdataset`` с ключом подсета, по
+        уровням обзоров — ``overview_level``; уже выписанные через
+        ``pixel_values``/``subdataset`` события не повторяются. Области
+        отличий выписываются событиями ``region`` (по убыванию площади) после
+        ``regions`` с их общим числом и, как в текстовом отчёте, считаются
+        различием.
+        """
+        if checks is None:
+            self.event("summary", identical=True, equal=True)
+            return False
+        equal = self._section(
+            checks, pixel_values, show_pixel_values, overview_values, regions,
+            pixel_values_sent=self._pixel_values_sent,
+        )
+        for key, section in (subdatasets or {}).items():
+            if key in self._subdatasets:
+                sub_equal = self._subdatasets[key]
+            else:
+                sub_equal = self._section(*section, show_pixel_values, subdataset=key)
+            equal = sub_equal and equal
+        self.event("summary", identical=False, equal=equal)
+        return not equal
@@ -2,19 +2,33 @@ import hashlib
 import os
 from collections.abc import Callable
 
+from rio_diff import profiling
+
 _HASH_CHUNK_BYTES = 1024 * 1024
 
 
-def calc_hash(inp_file: str, progress: Callable[[float], None] | None = None) -> str:
+def calc_hash(
+    inp_file: str,
+    progress: Callable[[float], None] | None = None,
+    profile: profiling.PhaseProfile | None = None,
+    stop: Callable[[], bool] | None = None,
+) -> str:
     hash = hashlib.md5()
     total = os.path.getsize(inp_file)
     done = 0
 
     with open(inp_file, "rb") as file:
-        for chunk in iter(lambda: file.read(_HASH_CHUNK_BYTES), b""):
-            hash.update(chunk)
+        while stop is None or not stop():
+            with profiling.timer(profile, "read"):
+                chunk = file.read(_HASH_CHUNK_BYTES)
+            if not chunk:
+                break
+            with profiling.timer(profile, "reduce"):
+                hash.update(chunk)
+            done += len(chunk)
             if progress is not None and total:
-                done += len(chunk)
                 progress(done / total)
 
+    if profile is not None:
+        profile.bytes_read = done
     return hash.hexdigest()
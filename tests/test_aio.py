@@ -0,0 +1,104 @@
+"""Асинхронный интерфейс: сроки, отмена и ограничение числа сравнений."""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from rio_diff import aio
+from rio_diff.compare import compare_rasters
+
+
+@pytest.fixture(scope="module")
+def pair(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("aio")
+    rng = np.random.default_rng(2)
+    base = rng.integers(0, 100, (1, 512, 512)).astype("uint8")
+    paths = []
+    for name, data in (("base.tif", base), ("test.tif", base + 1)):
+        path = directory / name
+        with rasterio.open(
+            path, "w", driver="GTiff", width=512, height=512, count=1, dtype="uint8", tiled=True,
+            blockxsize=64, blockysize=64, crs="EPSG:32637", transform=from_origin(500000, 6000000, 10, 10),
+        ) as ds:
+            ds.write(data)
+        paths.append(str(path))
+    return paths
+
+
+def _slow_progress(complete, phase):
+    time.sleep(0.02)  # каждое окно — не меньше 20 мс, сравнение целиком — больше секунды
+
+
+def test_timeout_returns_partial_report(pair):
+    start = time.monotonic()
+    report = asyncio.run(aio.compare_rasters_async(*pair, timeout=0.2, progress=_slow_progress))
+    assert report.complete is False
+    assert time.monotonic() - start < 1.0
+
+
+def test_cancel_raises_after_worker_is_released(pair, monkeypatch):
+    started, finished = threading.Event(), threading.Event()
+
+    def tracked(*args, **kwargs):
+        started.set()
+        try:
+            return compare_rasters(*args, **kwargs)
+        finally:
+            finished.set()
+
+    monkeypatch.setattr(aio, "compare_rasters", tracked)
+
+    async def run():
+        task = asyncio.create_task(aio.compare_rasters_async(*pair, progress=_slow_progress))
+        await asyncio.to_thread(started.wait, 5)
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # CancelledError пришёл только после того, как поток отпустил растры.
+        assert finished.is_set()
+
+    asyncio.run(run())
+
+
+def test_session_limits_concurrency_and_counts_slot_wait(pair, monkeypatch):
+    lock = threading.Lock()
+    running = peak = 0
+
+    def tracked(*args, **kwargs):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        try:
+            time.sleep(0.1)
+            return compare_rasters(*args, **kwargs)
+        finally:
+            with lock:
+                running -= 1
+
+    monkeypatch.setattr(aio, "compare_rasters", tracked)
+
+    async def run():
+        # Потоков у пула больше, чем слотов: ограничивает именно сессия.
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            session = aio.AsyncSession(max_concurrency=2, executor=executor)
+            reports = await asyncio.gather(*(session.compare(*pair) for _ in range(5)))
+        assert peak == 2
+        assert all(report.complete for report in reports)
+
+        async with aio.AsyncSession(max_concurrency=1) as session:
+            slow = asyncio.create_task(session.compare(*pair, progress=_slow_progress))
+            await asyncio.sleep(0)
+            # Срок истекает, пока второе сравнение ждёт слота.
+            waiting = await session.compare(*pair, timeout=0.2)
+            assert waiting.complete is False
+            assert (await slow).complete
+
+    asyncio.run(run())
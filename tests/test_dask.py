@@ -0,0 +1,51 @@
+"""Dask-бэкенд: те же результаты, счётчики профиля и остановка между кусками."""
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from rio_diff import compare, profiling
+
+pytest.importorskip("dask")
+
+
+@pytest.fixture(scope="module")
+def pair(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("dask")
+    rng = np.random.default_rng(4)
+    base = rng.integers(0, 100, (2, 512, 512)).astype("int16")
+    test = base.copy()
+    test[:, rng.random((512, 512)) < 0.1] += 1
+    paths = []
+    for name, data in (("base.tif", base), ("test.tif", test)):
+        path = directory / name
+        with rasterio.open(
+            path, "w", driver="GTiff", width=512, height=512, count=2, dtype="int16", tiled=True,
+            blockxsize=64, blockysize=64, crs="EPSG:32637", transform=from_origin(500000, 6000000, 10, 10),
+        ) as ds:
+            ds.write(data)
+        paths.append(str(path))
+    return paths
+
+
+def test_dask_matches_local_and_forwards_counters(pair):
+    profile = profiling.PhaseProfile("pixels")
+    assert compare.calc_diff(*pair, backend="dask", workers=2, profile=profile) == compare.calc_diff(*pair)
+    assert profile.windows == 64
+    assert profile.read_time > 0
+    assert profile.reduce_time > 0
+
+
+def test_stop_interrupts_dask_between_chunks(pair):
+    calls = 0
+
+    def stop():
+        nonlocal calls
+        calls += 1
+        return calls > 5
+
+    pixel_values, _, _ = compare.calc_diff(*pair, backend="dask", workers=2, stop=stop)
+    full, _, _ = compare.calc_diff(*pair)
+    counts = [stat.diff_count for stat in pixel_values]
+    assert all(0 < count < stat.diff_count for count, stat in zip(counts, full))
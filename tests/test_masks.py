@@ -0,0 +1,84 @@
+"""Маски: общие маски датасета и альфа-канал дают те же счётчики, что поканальный ``read_masks``."""
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.enums import MaskFlags
+from rasterio.transform import from_origin
+
+from rio_diff.compare import calc_diff, calc_stats
+
+WIDTH, HEIGHT, COUNT = 150, 130, 4
+
+
+def _write(path, kind: str, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    data = rng.integers(1, 250, (COUNT, HEIGHT, WIDTH), dtype="uint8")
+    options = dict(
+        driver="GTiff", width=WIDTH, height=HEIGHT, count=COUNT, dtype="uint8", tiled=True,
+        blockxsize=64, blockysize=64, crs="EPSG:32637", transform=from_origin(500000, 6000000, 10, 10),
+    )
+    if kind == "rgba":
+        options.update(photometric="RGB", alpha="YES")
+        # Частичная прозрачность: маска — значения альфа-канала как есть.
+        data[3] = rng.choice(np.array([0, 128, 255], dtype="uint8"), (HEIGHT, WIDTH), p=[0.1, 0.1, 0.8])
+    elif kind == "nodata":
+        options["nodata"] = 0
+        data[rng.random(data.shape) < 0.1] = 0
+    with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True), rasterio.open(path, "w", **options) as ds:
+        ds.write(data)
+        if kind == "mask":
+            ds.write_mask(np.where(rng.random((HEIGHT, WIDTH)) < 0.15, 0, 255).astype("uint8"))
+
+
+def _needs_mask(ds) -> bool:
+    return any(MaskFlags.per_dataset in flags or MaskFlags.alpha in flags for flags in ds.mask_flag_enums)
+
+
+def _reference_stats(ds) -> list[tuple]:
+    stats = []
+    for bidx in ds.indexes:
+        arr = ds.read(bidx).astype("float64")
+        if ds.nodatavals[bidx - 1] is not None:
+            arr[arr == ds.nodatavals[bidx - 1]] = np.nan
+        if _needs_mask(ds):
+            arr[ds.read_masks(bidx) == 0] = np.nan
+        valid = arr[np.isfinite(arr)]
+        stats.append((valid.min(), valid.max(), valid.mean(), valid.std()))
+    return stats
+
+
+def _reference_mask_diff(base_ds, test_ds) -> list[int]:
+    if not any(MaskFlags.per_dataset in flags for flags in (*base_ds.mask_flag_enums, *test_ds.mask_flag_enums)):
+        return [0] * base_ds.count
+    return [
+        int(np.count_nonzero(base_ds.read_masks(bidx) != test_ds.read_masks(bidx)))
+        for bidx in base_ds.indexes
+    ]
+
+
+def _as_tuples(stats) -> list[tuple]:
+    return [(stat.min, stat.max, stat.mean, stat.std) for stat in stats]
+
+
+@pytest.mark.parametrize("base_kind, test_kind", [
+    ("rgba", "rgba"),
+    ("mask", "mask"),
+    ("rgba", "mask"),
+    ("nodata", "mask"),
+    ("nodata", "nodata"),
+    ("plain", "rgba"),
+])
+def test_masks_match_per_band_reference(tmp_path, base_kind, test_kind):
+    base_path, test_path = str(tmp_path / "base.tif"), str(tmp_path / "test.tif")
+    _write(base_path, base_kind, seed=1)
+    _write(test_path, test_kind, seed=2)
+
+    pixel_values, base_stats, test_stats = calc_diff(base_path, test_path)
+
+    with rasterio.open(base_path) as base_ds, rasterio.open(test_path) as test_ds:
+        assert [stat.mask_diff_count for stat in pixel_values] == _reference_mask_diff(base_ds, test_ds)
+        for stats, ds, path in ((base_stats, base_ds, base_path), (test_stats, test_ds, test_path)):
+            expected = _reference_stats(ds)
+            np.testing.assert_allclose(_as_tuples(stats), expected)
+            np.testing.assert_allclose(_as_tuples(calc_stats(path)), expected)
@@ -0,0 +1,21 @@
+"""Профиль фаз: пик RSS относится к своей фазе."""
+
+import numpy as np
+import pytest
+
+from rio_diff import profiling
+
+
+def test_peak_rss_is_per_phase():
+    if not profiling._reset_peak_rss():
+        pytest.skip("peak RSS cannot be reset on this system")
+    profiler = profiling.Profiler()
+    size = 256 * 2 ** 20
+    with profiler.phase("big"):
+        data = np.ones(size, dtype=np.uint8)
+        del data
+    with profiler.phase("small"):
+        pass
+    big, small = profiler.phases
+    assert big.peak_rss - small.peak_rss > size // 2
+    assert "peak RSS MiB" in profiler.format_table()
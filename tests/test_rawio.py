@@ -0,0 +1,122 @@
+"""Окна из memory map совпадают с ``ds.read`` для всех поддерживаемых раскладок."""
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from rio_diff import rawio
+
+WIDTH, HEIGHT, COUNT = 410, 300, 3
+
+LAYOUTS = {
+    "tiled-pixel.tif": dict(driver="GTiff", tiled=True, blockxsize=128, blockysize=128),
+    "tiled-band.tif": dict(driver="GTiff", tiled=True, blockxsize=128, blockysize=128, interleave="band"),
+    # Тайл больше растра: краевые тайлы хранятся полного размера.
+    "tiled-oversized.tif": dict(driver="GTiff", tiled=True, blockxsize=512, blockysize=512),
+    "striped-pixel.tif": dict(driver="GTiff", blockysize=7),
+    "striped-band.tif": dict(driver="GTiff", blockysize=7, interleave="band"),
+    "big-endian.tif": dict(driver="GTiff", tiled=True, blockxsize=128, blockysize=128, ENDIANNESS="BIG"),
+    "bsq.img": dict(driver="ENVI", INTERLEAVE="BSQ"),
+    "bil.img": dict(driver="ENVI", INTERLEAVE="BIL"),
+    "bip.img": dict(driver="ENVI", INTERLEAVE="BIP"),
+}
+
+
+def _data(dtype: str) -> np.ndarray:
+    rng = np.random.default_rng(7)
+    if np.dtype(dtype).kind == "f":
+        return (rng.standard_normal((COUNT, HEIGHT, WIDTH)) * 1000).astype(dtype)
+    info = np.iinfo(dtype)
+    return rng.integers(info.min, info.max, (COUNT, HEIGHT, WIDTH), dtype=dtype, endpoint=True)
+
+
+def _write(path, data: np.ndarray, window=None, **options) -> None:
+    with rasterio.open(
+        path, "w", width=WIDTH, height=HEIGHT, count=COUNT, dtype=data.dtype.name,
+        crs="EPSG:3857", transform=from_origin(500000, 6000000, 10, 10), **options,
+    ) as ds:
+        ds.write(data, window=window)
+
+
+def _served_windows(ds, windows) -> int:
+    """Сверить с ``ds.read`` каждое окно, которое отдал быстрый путь; вернуть их число."""
+    reader = rawio.reader(ds)
+    assert reader is not None
+    served = 0
+    for window in windows:
+        arr = reader.read(window)
+        if arr is None:
+            continue
+        served += 1
+        expected = ds.read(window=window)
+        assert arr.shape == expected.shape
+        assert arr.dtype.newbyteorder("=") == expected.dtype
+        np.testing.assert_array_equal(arr, expected)
+    return served
+
+
+@pytest.mark.parametrize("dtype", ["uint16", "int16", "float32"])
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_block_windows_match_gdal(tmp_path, name, dtype):
+    path = tmp_path / name
+    _write(path, _data(dtype), **LAYOUTS[name])
+    with rasterio.open(path) as ds:
+        windows = [window for _, window in ds.block_windows(1)]
+        assert _served_windows(ds, windows) == len(windows)
+
+
+@pytest.mark.parametrize("name", ["bsq.img", "bil.img", "bip.img"])
+def test_envi_arbitrary_windows_match_gdal(tmp_path, name):
+    path = tmp_path / name
+    _write(path, _data("uint16"), **LAYOUTS[name])
+    windows = [Window(0, 0, WIDTH, HEIGHT), Window(3, 5, 17, 11), Window(WIDTH - 9, HEIGHT - 4, 9, 4)]
+    with rasterio.open(path) as ds:
+        assert _served_windows(ds, windows) == len(windows)
+
+
+def test_gtiff_off_grid_windows_fall_back(tmp_path):
+    path = tmp_path / "tiled.tif"
+    _write(path, _data("uint16"), **LAYOUTS["tiled-pixel.tif"])
+    with rasterio.open(path) as ds:
+        reader = rawio.reader(ds)
+        assert reader.read(Window(1, 0, 128, 128)) is None
+        assert reader.read(Window(0, 0, 64, 128)) is None
+
+
+def test_sparse_blocks_fall_back(tmp_path):
+    path = tmp_path / "sparse.tif"
+    data = _data("uint16")
+    _write(
+        path, data[:, :128, :128], window=Window(0, 0, 128, 128),
+        driver="GTiff", tiled=True, blockxsize=128, blockysize=128, SPARSE_OK=True,
+    )
+    with rasterio.open(path) as ds:
+        windows = [window for _, window in ds.block_windows(1)]
+        # Записан только первый тайл, остальные читаются через GDAL.
+        assert _served_windows(ds, windows) == 1
+
+
+@pytest.mark.parametrize("options", [
+    dict(driver="GTiff", compress="deflate"),
+    dict(driver="GTiff", nbits=12),
+])
+def test_unsupported_layouts_use_gdal(tmp_path, options):
+    path = tmp_path / "other.tif"
+    _write(path, _data("uint16") & 0x0FFF, **options)
+    with rasterio.open(path) as ds:
+        assert rawio.reader(ds) is None
+
+
+def test_truncated_file_falls_back(tmp_path):
+    path = tmp_path / "truncated.tif"
+    _write(path, _data("uint16"), **LAYOUTS["tiled-pixel.tif"])
+    with open(path, "r+b") as file:
+        file.truncate(path.stat().st_size // 2)
+    with rasterio.open(path) as ds:
+        windows = [window for _, window in ds.block_windows(1)]
+        # Тайлы за обрезом читает GDAL и сам сообщает об ошибке.
+        assert 0 < _served_windows(ds, windows) < len(windows)
+        with pytest.raises(rasterio.errors.RasterioIOError):
+            ds.read(window=windows[-1])
@@ -0,0 +1,146 @@
+"""Области отличий: склейка по окнам и влияние на код выхода."""
+
+import json
+
+import numpy as np
+import pytest
+import rasterio
+from click.testing import CliRunner
+from affine import Affine
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from rio_diff.compare import compare_rasters
+from rio_diff.regions import RegionLabeler
+from rio_diff.scripts.cli import diff
+
+ndimage = pytest.importorskip("scipy.ndimage")
+
+
+def _write(path, data: np.ndarray, **options) -> None:
+    with rasterio.open(
+        path, "w", driver="GTiff", width=data.shape[2], height=data.shape[1], count=data.shape[0],
+        dtype=data.dtype.name, crs="EPSG:32637", transform=from_origin(500000, 6000000, 10, 10), **options,
+    ) as ds:
+        ds.write(data)
+
+
+@pytest.fixture
+def changed_pair(tmp_path):
+    base = np.zeros((1, 64, 64), dtype="uint8")
+    test = base.copy()
+    test[0, 5:9, 5:9] = 3
+    _write(tmp_path / "base.tif", base)
+    _write(tmp_path / "test.tif", test)
+    return str(tmp_path / "base.tif"), str(tmp_path / "test.tif")
+
+
+@pytest.mark.parametrize("output_format", ["text", "json", "ndjson"])
+def test_regions_count_as_difference_in_every_format(tmp_path, changed_pair, output_format):
+    result = CliRunner().invoke(diff, [
+        "--ignore-pixels", "--ignore-stats", "--regions", str(tmp_path / "regions.geojson"),
+        "--format", output_format, *changed_pair,
+    ])
+    assert result.exit_code == 1, result.output
+    if output_format == "json":
+        assert json.loads(result.output)["equal"] is False
+    elif output_format == "ndjson":
+        assert json.loads(result.output.splitlines()[-1]) == {"event": "summary", "identical": False, "equal": False}
+
+
+def _whole_raster_regions(changed: np.ndarray, magnitude: np.ndarray) -> list[tuple]:
+    """Области по всему растру сразу: (число пикселей, максимум разности, охват в пикселях)."""
+    labels, count = ndimage.label(changed)
+    sizes = np.bincount(labels.ravel(), minlength=count + 1)[1:]
+    maxima = ndimage.maximum(magnitude, labels, np.arange(1, count + 1))
+    regions = []
+    for label, (rows, cols) in enumerate(ndimage.find_objects(labels), start=1):
+        regions.append((int(sizes[label - 1]), float(maxima[label - 1]), (cols.start, rows.start, cols.stop, rows.stop)))
+    return sorted(regions, key=lambda region: (-region[0], -region[1], region[2][1], region[2][0]))
+
+
+@pytest.mark.parametrize("layout", [
+    dict(tiled=True, blockxsize=128, blockysize=128),
+    dict(tiled=False, blockysize=5),
+])
+def test_stitching_matches_whole_raster_labeling(tmp_path, layout):
+    rng = np.random.default_rng(3)
+    height, width = 700, 900
+    base = rng.integers(0, 100, (2, height, width)).astype("int16")
+    test = base.copy()
+    blobs = ndimage.binary_dilation(rng.random((height, width)) < 0.0005, iterations=6)
+    test[0][blobs] += 5
+    test[1, 100:400, 250:270] -= 3  # полоса через границы окон
+    test[1, 0, :] += 1  # край растра
+    _write(tmp_path / "base.tif", base, **layout)
+    _write(tmp_path / "test.tif", test, **layout)
+
+    report = compare_rasters(str(tmp_path / "base.tif"), str(tmp_path / "test.tif"), collect_regions=True, max_regions=20)
+
+    magnitude = np.abs(base.astype("float64") - test).max(axis=0)
+    expected = _whole_raster_regions((base != test).any(axis=0), magnitude)
+    assert report.regions.total_count == len(expected)
+    assert [(region.count, region.max_diff) for region in report.regions.regions] == [
+        (count, max_diff) for count, max_diff, _ in expected[:20]
+    ]
+    # Охват в координатах растра: x — от левого края, y — вниз от верхнего.
+    count, _, (col_min, row_min, col_max, row_max) = expected[0]
+    assert report.regions.regions[0].bbox == (
+        500000 + 10 * col_min, 6000000 - 10 * row_max, 500000 + 10 * col_max, 6000000 - 10 * row_min,
+    )
+
+
+@pytest.mark.parametrize("block", [(7, 5), (32, 32), (1, 64)])
+def test_labeler_on_dense_noise(block):
+    """Почти все области пересекают края окон; итог совпадает с разметкой целиком."""
+    rng = np.random.default_rng(9)
+    changed = rng.random((96, 80)) < 0.45
+    magnitude = rng.random(changed.shape)
+    labeler = RegionLabeler()
+    block_rows, block_cols = block
+    for row in range(0, changed.shape[0], block_rows):
+        for col in range(0, changed.shape[1], block_cols):
+            window = Window(col, row, min(block_cols, changed.shape[1] - col), min(block_rows, changed.shape[0] - row))
+            part = (slice(row, row + window.height), slice(col, col + window.width))
+            labeler.update(window, changed[part], magnitude[part])
+    result = labeler.result(Affine.identity())
+
+    expected = _whole_raster_regions(changed, np.where(changed, magnitude, 0))
+    assert result.total_count == len(expected)
+    assert [(region.count, region.max_diff, region.bbox) for region in result.regions] == [
+        (count, max_diff, tuple(float(value) for value in bbox)) for count, max_diff, bbox in expected
+    ]
+
+
+def test_windows_without_changes_keep_nothing():
+    labeler = RegionLabeler(max_regions=5)
+    changed = np.zeros((16, 16), dtype=bool)
+    magnitude = np.zeros((16, 16))
+    for row in range(0, 160, 16):
+        for col in range(0, 160, 16):
+            labeler.update(Window(col, row, 16, 16), changed, magnitude)
+    assert labeler._finished == []
+    assert all(edge is None for edge in labeler._edges.values())
+    assert labeler.result(Affine.identity()).total_count == 0
+
+
+def test_identical_files_write_empty_regions(tmp_path):
+    data = np.zeros((1, 64, 64), dtype="uint8")
+    _write(tmp_path / "base.tif", data)
+    _write(tmp_path / "test.tif", data)
+    path = tmp_path / "regions.geojson"
+    result = CliRunner().invoke(diff, ["--regions", str(path), str(tmp_path / "base.tif"), str(tmp_path / "test.tif")])
+    assert result.exit_code == 0, result.output
+    document = json.loads(path.read_text())
+    assert document["features"] == []
+    assert document["crs"]["properties"]["name"] == "EPSG:32637"
+
+
+def test_uncompared_pixels_write_empty_regions(tmp_path):
+    _write(tmp_path / "base.tif", np.zeros((1, 64, 64), dtype="uint8"))
+    _write(tmp_path / "test.tif", np.zeros((1, 32, 64), dtype="uint8"))
+    path = tmp_path / "regions.geojson"
+    result = CliRunner().invoke(diff, ["--regions", str(path), str(tmp_path / "base.tif"), str(tmp_path / "test.tif")])
+    assert result.exit_code == 1
+    assert "Change regions not computed" in result.output
+    assert json.loads(path.read_text())["features"] == []
@@ -0,0 +1,158 @@
+"""Допуски попиксельного сравнения: ULP-расстояние и совпадение с ``np.isclose``."""
+
+import numpy as np
+import pytest
+import rasterio
+from click.testing import CliRunner
+from rasterio.transform import from_origin
+
+from rio_diff import models
+from rio_diff.compare import _changed, _ulp_close, calc_diff
+from rio_diff.scripts.cli import diff
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_ulp_signed_zeros_are_equal(dtype):
+    base = np.array([0.0, -0.0, 0.0], dtype=dtype)
+    test = np.array([-0.0, 0.0, 0.0], dtype=dtype)
+    assert _ulp_close(base, test, 0).all()
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_ulp_distance_across_the_sign_boundary(dtype):
+    tiny = np.finfo(dtype).smallest_subnormal
+    base = np.array([tiny, tiny, -tiny], dtype=dtype)
+    test = np.array([-tiny, 0.0, -2 * tiny], dtype=dtype)
+    # tiny и -tiny разделяют два шага: до +0 (== -0) и от -0.
+    assert _ulp_close(base, test, 2).tolist() == [True, True, True]
+    assert _ulp_close(base, test, 1).tolist() == [False, True, True]
+    assert _ulp_close(base, test, 0).tolist() == [False, False, False]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_ulp_distance_of_neighbours(dtype):
+    values = np.array([1.0, -3.5, 1e-30, 0.0, -np.finfo(dtype).max], dtype=dtype)
+    neighbours = values
+    for _ in range(3):
+        neighbours = np.nextafter(neighbours, np.array(np.inf, dtype=dtype))
+    assert _ulp_close(values, neighbours, 3).all()
+    assert not _ulp_close(values, neighbours, 2).any()
+
+
+def test_ulp_huge_limit_does_not_overflow():
+    base = np.array([-np.finfo("float32").max, 1.0], dtype="float32")
+    test = np.array([np.finfo("float32").max, 1.0], dtype="float32")
+    assert _ulp_close(base, test, 2 ** 62).all()
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_ulp_byte_swapped_input(dtype):
+    native = np.array([1.0, 0.0, -2.0, 5.0], dtype=dtype)
+    test = np.nextafter(native, np.array(np.inf, dtype=dtype))
+    swapped = native.astype(native.dtype.newbyteorder())
+    assert _ulp_close(swapped, test, 1).tolist() == _ulp_close(native, test, 1).tolist() == [True] * 4
+    assert _ulp_close(swapped, test.astype(test.dtype.newbyteorder()), 0).tolist() == [False] * 4
+
+
+def _random_pair(rng, dtype: str, shape) -> tuple[np.ndarray, np.ndarray]:
+    if np.dtype(dtype).kind == "f":
+        base = rng.standard_normal(shape).astype(dtype) * 10
+        base.flat[rng.choice(base.size, 20, replace=False)] = [np.nan] * 10 + [np.inf] * 5 + [-np.inf] * 5
+    else:
+        base = rng.integers(0, 100, shape).astype(dtype)
+    test = base.copy()
+    changed = rng.random(shape) < 0.2
+    test[changed] = (test[changed] + rng.integers(1, 5, changed.sum())).astype(dtype)
+    test.flat[:3] = base.flat[:3][::-1]  # в том числе NaN/бесконечности на одной стороне
+    return base, test
+
+
+@pytest.mark.parametrize("tolerance", [
+    models.Tolerance(atol=0.5),
+    models.Tolerance(rtol=0.1),
+    models.Tolerance(atol=1.0, rtol=0.01),
+])
+@pytest.mark.parametrize("equal_nan", [True, False])
+def test_changed_matches_isclose(tolerance, equal_nan):
+    rng = np.random.default_rng(5)
+    base, test = _random_pair(rng, "float32", (64, 64))
+    arr_base, arr_test = base.astype("float64"), test.astype("float64")
+    with np.errstate(invalid="ignore"):
+        abs_diff = np.abs(arr_base - arr_test)
+    expected = ~np.isclose(arr_base, arr_test, rtol=tolerance.rtol, atol=tolerance.atol, equal_nan=equal_nan)
+    actual = _changed(base, test, arr_base, arr_test, abs_diff, tolerance, equal_nan)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def _write(path, data: np.ndarray, nodata) -> None:
+    with rasterio.open(
+        path, "w", driver="GTiff", width=data.shape[2], height=data.shape[1], count=data.shape[0],
+        dtype=data.dtype.name, nodata=nodata, tiled=True, blockxsize=64, blockysize=64,
+        crs="EPSG:32637", transform=from_origin(500000, 6000000, 10, 10),
+    ) as ds:
+        ds.write(data)
+
+
+@pytest.mark.parametrize("dtype, nodata", [
+    ("uint8", None),
+    ("uint8", 0),
+    ("int16", -1),
+    ("float32", None),
+    ("float32", -9999.0),
+    ("float32", float("nan")),
+])
+def test_exact_native_path_matches_isclose(tmp_path, dtype, nodata):
+    """Точное сравнение по исходным значениям даёт те же счётчики, что ``np.isclose`` по float64."""
+    rng = np.random.default_rng(11)
+    base, test = _random_pair(rng, dtype, (2, 150, 130))
+    if nodata is not None and not np.isnan(nodata):
+        holes = rng.random(base.shape) < 0.05
+        base[holes] = nodata
+        test[rng.random(test.shape) < 0.05] = nodata
+    _write(tmp_path / "base.tif", base, nodata)
+    _write(tmp_path / "test.tif", test, nodata)
+
+    pixel_values, _, _ = calc_diff(str(tmp_path / "base.tif"), str(tmp_path / "test.tif"), collect_stats=False)
+
+    arr_base, arr_test = base.astype("float64"), test.astype("float64")
+    if nodata is not None:
+        arr_base[base == nodata] = np.nan
+        arr_test[test == nodata] = np.nan
+    expected = (~np.isclose(arr_base, arr_test, rtol=0, atol=0, equal_nan=True)).sum(axis=(1, 2))
+    assert [stat.diff_count for stat in pixel_values] == expected.tolist()
+
+
+def test_band_tolerance_rejects_negative_values(tmp_path):
+    runner = CliRunner()
+    for spec in ("1:atol=-1", "1:rtol=-0.5", "1:max_ulps=-3"):
+        result = runner.invoke(diff, ["--band-tolerance", spec, str(tmp_path), str(tmp_path)])
+        assert result.exit_code == 2
+        assert "must be >= 0" in result.output
+
+
+def test_band_tolerance_rejects_unknown_band(tmp_path):
+    data = np.zeros((2, 64, 64), dtype="uint8")
+    _write(tmp_path / "base.tif", data, None)
+    _write(tmp_path / "test.tif", data + 1, None)
+    with pytest.raises(ValueError, match="band 3"):
+        calc_diff(str(tmp_path / "base.tif"), str(tmp_path / "test.tif"), band_tolerances={3: models.Tolerance()})
+    result = CliRunner().invoke(
+        diff, ["--band-tolerance", "3:atol=1", str(tmp_path / "base.tif"), str(tmp_path / "test.tif")],
+    )
+    assert result.exit_code == 2
+    assert "band 3" in result.output
+
+
+def test_other_value_errors_are_not_usage_errors(tmp_path, monkeypatch):
+    data = np.zeros((1, 64, 64), dtype="uint8")
+    _write(tmp_path / "base.tif", data, None)
+    _write(tmp_path / "test.tif", data + 1, None)
+
+    def fail(*args, **kwargs):
+        raise ValueError("cannot reshape array")
+
+    monkeypatch.setattr("rio_diff.compare.compare_rasters", fail)
+    result = CliRunner().invoke(diff, [str(tmp_path / "base.tif"), str(tmp_path / "test.tif")])
+    assert result.exit_code != 2
+    assert isinstance(result.exception, ValueError)
+    assert "--band-tolerance" not in result.output